@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+import os
+import sys
+import time
+import random
+import tempfile
+import xml.etree.ElementTree as baseline_etree
+
+from peptagram import parse
+from peptagram import prophet
+from peptagram import mascot
+
+
+"""
+Benchmarks for the peptagram parsers.
+
+  python benchmark.py [job.pep.xml]
+
+If no pepXML file is given, a synthetic pepXML file is generated.
+Mascot Ions1 parsing is benchmarked on synthetic peak lists.
+"""
+
+
+def make_pepxml(fname, n_scan=100000):
+  "Writes a synthetic PeptideProphet pepXML file with n_scan queries"
+  random.seed(1)
+  ns = 'http://regis-web.systemsbiology.net/pepXML'
+  f = open(fname, 'w')
+  f.write('<?xml version="1.0"?>\n')
+  f.write('<msms_pipeline_analysis xmlns="%s">\n' % ns)
+  f.write('<analysis_summary analysis="peptideprophet">\n')
+  f.write('<peptideprophet_summary>\n<roc_error_data charge="all">\n')
+  error_points = [
+      (0.0, 1.0), (0.01, 0.97), (0.02, 0.9), (0.05, 0.7),
+      (0.1, 0.4), (0.3, 0.1), (0.6, 0.0)]
+  for error, prob in error_points:
+    f.write('<error_point error="%s" min_prob="%s" num_corr="1" num_incorr="1"/>\n' % (error, prob))
+  f.write('</roc_error_data>\n</peptideprophet_summary>\n</analysis_summary>\n')
+  f.write('<msms_run_summary base_name="/data/run" raw_data=".mzML">\n')
+  for i in range(n_scan):
+    charge = random.choice((2, 3))
+    f.write(
+        '<spectrum_query spectrum="run.%d.%d.%d" start_scan="%d" end_scan="%d" '
+        'precursor_neutral_mass="1000.5" assumed_charge="%d" index="%d" '
+        'retention_time_sec="100.5">\n<search_result>\n'
+        % (i, i, charge, i, i, charge, i+1))
+    f.write(
+        '<search_hit hit_rank="1" peptide="PEPTIDEK" peptide_prev_aa="K" '
+        'peptide_next_aa="A" protein="sp|P%05d|PROT" num_tot_proteins="1" '
+        'num_matched_ions="5" tot_num_ions="14" calc_neutral_pep_mass="1000.4" '
+        'massdiff="0.1" num_tol_term="2" num_missed_cleavages="0" is_rejected="0">\n'
+        % (i % 1000))
+    f.write(
+        '<modification_info modified_peptide="PEPM[147]IDEK">'
+        '<mod_aminoacid_mass position="4" mass="147.035"/></modification_info>\n')
+    f.write('<search_score name="ionscore" value="%d"/>\n' % (i % 90))
+    f.write('<search_score name="expect" value="%g"/>\n' % 10**random.uniform(-12, 0))
+    f.write(
+        '<analysis_result analysis="peptideprophet">'
+        '<peptideprophet_result probability="%.4f" all_ntt_prob="(0,0,1)">'
+        '<search_score_summary><parameter name="fval" value="1.5"/>'
+        '<parameter name="massd" value="0.1"/></search_score_summary>'
+        '</peptideprophet_result></analysis_result>\n' % random.random())
+    f.write('</search_hit>\n</search_result>\n</spectrum_query>\n')
+  f.write('</msms_run_summary>\n</msms_pipeline_analysis>\n')
+  f.close()
+
+
+def read_pepxml_baseline(pepxml):
+  """
+  Yields the scans of pepxml as the PepxmlReader did before the fast
+  XML backend: the pure-python ElementTree over all elements, with 
+  every attribute converted. Kept as the reference for the benchmark.
+  """
+  nsmap = {}
+  search_tag = lambda tag: parse.fixtag('', tag, nsmap)
+  findall = lambda elem, tag: elem.findall(search_tag(tag))
+  distribution = None
+  events = ('start', 'end', 'start-ns')
+  for event, elem in baseline_etree.iterparse(pepxml, events=events):
+    if event == 'start-ns':
+      nsmap.update({elem})
+    elif event != 'end':
+      continue
+    elif elem.tag == search_tag('peptideprophet_summary'):
+      distribution = []
+      for charge_elem in findall(elem, 'roc_error_data'):
+        if charge_elem.attrib['charge'] == 'all':
+          for error_elem in findall(charge_elem, 'error_point'):
+            attrib = parse.parse_attrib(error_elem)
+            distribution.append(
+                {'error': attrib['error'], 'prob': attrib['min_prob']})
+      distribution.sort(key=lambda d: d['error'])
+      elem.clear()
+    elif elem.tag == search_tag('spectrum_query'):
+      scan = parse.parse_attrib(elem)
+      scan['matches'] = []
+      for search_elem in findall(elem, 'search_result'):
+        search_hit_elem = search_elem[0]
+        match = parse.parse_attrib(search_hit_elem)
+        match['modifications'] = []
+        for modified_elem in findall(search_hit_elem, 'modification_info'):
+          for mod_elem in findall(modified_elem, 'mod_aminoacid_mass'):
+            match['modifications'].append(parse.parse_attrib(mod_elem))
+        for score_elem in findall(search_hit_elem, 'search_score'):
+          match.update(parse.parse_name_value(score_elem))
+        analysis_elem = search_hit_elem.find(search_tag('analysis_result'))
+        for result_elem in analysis_elem:
+          if result_elem.tag == search_tag('peptideprophet_result'):
+            match.update(parse.parse_attrib(result_elem))
+            for param_elem in result_elem[0]:
+              match.update(parse.parse_name_value(param_elem))
+        match['fpe'] = prophet.probability_to_error(
+            distribution, match['probability'])
+        scan['matches'].append(match)
+      yield scan
+      elem.clear()
+
+
+def time_reader(scans):
+  "Returns (n_scan, seconds) to read all the scans of an iterator"
+  start = time.time()
+  n_scan = 0
+  for scan in scans:
+    n_scan += 1
+  return n_scan, time.time() - start
+
+
+def benchmark_pepxml(pepxml):
+  backends = [('baseline', None), ('etree', False)]
+  if parse.lxml_etree is not None:
+    backends.append(('lxml', True))
+  use_lxml = parse.use_lxml
+  try:
+    for name, is_lxml in backends:
+      if is_lxml is None:
+        scans = read_pepxml_baseline(pepxml)
+      else:
+        parse.use_lxml = is_lxml
+        scans = prophet.PepxmlReader(pepxml)
+      n_scan, seconds = time_reader(scans)
+      print('PepxmlReader [%s]: %d scans in %.2fs (%.0f scans/s)' % (
+          name, n_scan, seconds, n_scan/seconds))
+  finally:
+    parse.use_lxml = use_lxml
+
+
+def make_ions1(n_peak):
+  "Returns a synthetic Mascot Ions1 string of n_peak peaks"
+  return ','.join(
+      '%.4f:%.4g' % (random.uniform(100, 2000), random.uniform(1, 1E5))
+      for i in range(n_peak))
+
+
+def benchmark_ions1(n_query=1000, n_peak=2000):
+  random.seed(1)
+  ions1_strs = [make_ions1(n_peak) for i in range(n_query)]
+  use_numpys = [False]
+  if mascot.np is not None:
+    use_numpys.append(True)
+  for use_numpy in use_numpys:
+    start = time.time()
+    for s in ions1_strs:
+      mascot.parse_ions1(s, use_numpy)
+    seconds = time.time() - start
+    print('parse_ions1 [%s]: %d queries of %d peaks in %.2fs' % (
+        'numpy' if use_numpy else 'python', n_query, n_peak, seconds))
+
+
+if __name__ == "__main__":
+  if len(sys.argv) > 1:
+    pepxml = sys.argv[1]
+    benchmark_pepxml(pepxml)
+  else:
+    pepxml = os.path.join(tempfile.mkdtemp(), 'benchmark.pep.xml')
+    print('Generating %s...' % pepxml)
+    make_pepxml(pepxml)
+    print('pepXML size: %s' % parse.size_str(pepxml))
+    try:
+      benchmark_pepxml(pepxml)
+    finally:
+      os.remove(pepxml)
+      os.rmdir(os.path.dirname(pepxml))
+  benchmark_ions1()
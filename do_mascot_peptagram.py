@@ -26,6 +26,8 @@ test_params = {
   'fasta': 'example_data/mascot/HUMAN.fasta',
   'include_msms': 1,
   'match_filter': 3,
+  'shard_proteins': 0,
+  'pack_spectra': 0,
 }
 
 
@@ -38,27 +40,38 @@ def convert_mascot_to_peptagram(params, print_fn=sys.stdout.write):
 
   great_ionscore = float(params['great_ionscore'])
   cutoff_ionscore = float(params['cutoff_ionscore'])
+  n_peak = None
+  if params.get('n_peak'):
+    n_peak = int(params['n_peak'])
   proteins = {}
+  scans = {}
   labels = []
 
   for fname, label in params['files_and_labels']:
-    labels.append(label)
     size = parse.size_str(fname)
     print_fn("Processing %s (%s)...\n" % (fname, size))
     these_proteins = peptagram.mascot.get_proteins(
-        fname, great_ionscore, cutoff_ionscore)
+        fname, great_ionscore, cutoff_ionscore, 
+        scans=scans,
+        include_spectrum=params.get('include_msms', 1) != 0,
+        i_source=len(labels),
+        n_peak=n_peak)
     proteins = peptagram.proteins.merge_two_proteins(
-        proteins, these_proteins)
+        proteins, these_proteins, len(labels))
+    labels.append(label)
 
   peptagram.proteins.filter_proteins(proteins, params)
 
   peptagram.proteins.make_graphical_comparison_visualisation({
       'title': params['title'],
       'proteins': proteins,
+      'scans': scans,
       'source_labels': labels,
       'color_names': [great_ionscore, cutoff_ionscore],
       'out_dir': params['out_dir'],
-  })
+  },
+      shard_proteins=params.get('shard_proteins', 0) != 0,
+      pack_spectra=params.get('pack_spectra', 0) != 0)
 
   html = os.path.join(params['out_dir'], 'index.html')
   size = parse.size_str(params['out_dir'])
@@ -93,6 +106,10 @@ class PeptagramForm(tkform.Form):
         'title', 'Title', 'Mascot Peptagram')
     self.push_labeled_param(
         'out_dir', 'Output directory', 'peptagram-mascot', load_dir_text='select directory')
+    self.push_checkbox_param(
+        'shard_proteins', 'Split proteins into separate files', init_val='0')
+    self.push_checkbox_param(
+        'pack_spectra', 'Pack MS/MS spectra as float32', init_val='0')
 
     self.push_spacer()
     self.push_line()
@@ -26,6 +26,8 @@ test_params = {
   'out_dir': 'peptagram-maxquant',
   'include_msms': 1,
   'match_filter': 3,
+  'shard_proteins': 0,
+  'pack_spectra': 0,
 }
 
 
@@ -47,9 +49,12 @@ def convert_maxquant_to_peptagram(params, print_fn=sys.stdout.write):
     print_fn("Processing %s (%s)...\n" % (fname, size))
     these_proteins, sources = \
         peptagram.maxquant.get_proteins_and_sources(
-            fname, great_expect=great_expect, cutoff_expect=cutoff_expect)
+            fname, 
+            great_expect=great_expect, 
+            cutoff_expect=cutoff_expect,
+            include_spectrum=params.get('include_msms', 1) != 0)
     proteins = peptagram.proteins.merge_two_proteins(
-        proteins, these_proteins)
+        proteins, these_proteins, len(labels))
     labels.extend(map(parse.basename, sources))
 
   peptagram.proteins.filter_proteins(proteins, params)
@@ -62,7 +67,9 @@ def convert_maxquant_to_peptagram(params, print_fn=sys.stdout.write):
                       'PEP=%s'%params['cutoff_expect']],
       'mask_labels': [],
       'out_dir': params['out_dir'],
-  })
+  },
+      shard_proteins=params.get('shard_proteins', 0) != 0,
+      pack_spectra=params.get('pack_spectra', 0) != 0)
 
   html = os.path.join(params['out_dir'], 'index.html')
   size = parse.size_str(params['out_dir'])
@@ -98,6 +105,10 @@ class PeptagramForm(tkform.Form):
         'title', 'Title', 'Maxquant peptagram')
     self.push_labeled_param(
         'out_dir', 'Output directory', 'peptagram-maxquant', load_dir_text='select directory')
+    self.push_checkbox_param(
+        'shard_proteins', 'Split proteins into separate files', init_val='0')
+    self.push_checkbox_param(
+        'pack_spectra', 'Pack MS/MS spectra as float32', init_val='0')
 
     self.push_spacer()
     self.push_line()
@@ -27,6 +27,8 @@ test_params = {
   'out_dir': 'peptagram-morpheus',
   'include_msms': 0,
   'match_filter': 0,
+  'shard_proteins': 0,
+  'pack_spectra': 0,
   'n_peak': 50,
   'q_cutoff': 0.01,
   'q_good': 0,
@@ -58,14 +60,16 @@ def convert_morpheus_to_peptagram(params, print_fn=sys.stdout.write):
         peptagram.morpheus.get_proteins_and_sources(
             protein_group, fname, modifications, q_good, q_cutoff)
     proteins = peptagram.proteins.merge_two_proteins(
-        proteins, these_proteins)
+        proteins, these_proteins, len(labels))
     labels.extend(map(parse.basename, these_sources))
 
   n_peak = int(params['n_peak'])
+  i_source_mzmls = []
   for i_source, (mzml, label) in enumerate(params['mzmls_and_labels']):
-    print_fn("Extracting spectra from %s (%s)...\n" % (mzml, parse.size_str(mzml)))
-    peptagram.mzml.load_mzml(
-        proteins, i_source, mzml, n_peak)
+    i_source_mzmls.append((i_source, mzml))
+  if i_source_mzmls:
+    print_fn("Extracting spectra from %d mzML files...\n" % len(i_source_mzmls))
+    peptagram.mzml.load_mzmls(proteins, i_source_mzmls, n_peak)
 
   peptagram.proteins.filter_proteins(proteins, params)
 
@@ -76,7 +80,9 @@ def convert_morpheus_to_peptagram(params, print_fn=sys.stdout.write):
       'color_names': ['Q=%s' % q_good, 'Q=%s' % q_cutoff],
       'mask_labels': [],
       'out_dir': params['out_dir'],
-  })
+  },
+      shard_proteins=params.get('shard_proteins', 0) != 0,
+      pack_spectra=params.get('pack_spectra', 0) != 0)
 
   html = os.path.join(params['out_dir'], 'index.html')
   size = parse.size_str(params['out_dir'])
@@ -111,6 +117,10 @@ class PeptagramForm(tkform.Form):
         'title', 'Title', 'Morpheus Peptagram')
     self.push_labeled_param(
         'out_dir', 'Output directory', 'peptagram-morpheus', load_dir_text='select directory')
+    self.push_checkbox_param(
+        'shard_proteins', 'Split proteins into separate files', init_val='0')
+    self.push_checkbox_param(
+        'pack_spectra', 'Pack MS/MS spectra as float32', init_val='0')
 
     self.push_spacer()
     self.push_line()
@@ -27,6 +27,8 @@ test_params = {
   'out_dir': 'peptagram-pilot',
   'include_msms': 0,
   'match_filter': 3,
+  'shard_proteins': 0,
+  'pack_spectra': 0,
 }
 
 
@@ -40,12 +42,12 @@ def convert_pilot_to_peptagram(params, print_fn=sys.stdout.write):
   proteins = {}
   labels = []
   for fname, label in params['files_and_labels']:
-    labels.append(label)
     size = parse.size_str(fname)
     print_fn("Processing %s (%s)...\n" % (fname, size))
     these_proteins = peptagram.pilot.get_proteins(fname)
     proteins = peptagram.proteins.merge_two_proteins(
-        proteins, these_proteins)
+        proteins, these_proteins, len(labels))
+    labels.append(label)
 
   peptagram.proteins.filter_proteins(proteins, params)
 
@@ -56,7 +58,9 @@ def convert_pilot_to_peptagram(params, print_fn=sys.stdout.write):
       'color_names': [0, 1],
       'mask_labels': [],
       'out_dir': params['out_dir'],
-  })
+  },
+      shard_proteins=params.get('shard_proteins', 0) != 0,
+      pack_spectra=params.get('pack_spectra', 0) != 0)
 
   html = os.path.join(params['out_dir'], 'index.html')
   size = parse.size_str(params['out_dir'])
@@ -92,6 +96,10 @@ class PeptagramForm(tkform.Form):
         'title', 'Peptagram Title', 'Protein Pilot peptagram')
     self.push_labeled_param(
         'out_dir', 'Output Directory', 'peptagram-pilot', load_dir_text='select directory')
+    self.push_checkbox_param(
+        'shard_proteins', 'Split proteins into separate files', init_val='0')
+    self.push_checkbox_param(
+        'pack_spectra', 'Pack MS/MS spectra as float32', init_val='0')
 
     self.push_spacer()
     self.push_line()
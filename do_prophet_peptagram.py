@@ -33,6 +33,8 @@ test_params = {
   'out_dir': 'peptagram-prophet',
   'include_msms': 1,
   'match_filter': 3,
+  'shard_proteins': 0,
+  'pack_spectra': 0,
 }
 
 
@@ -73,7 +75,9 @@ def convert_prophet_peptagram(params, print_fn=sys.stdout.write):
       'color_names': ['expect=%s' % great_expect, 'expect=%s' % cutoff_expect],
       'mask_labels': [],
       'out_dir': params['out_dir'],
-  })
+  },
+      shard_proteins=params.get('shard_proteins', 0) != 0,
+      pack_spectra=params.get('pack_spectra', 0) != 0)
 
   html = os.path.join(params['out_dir'], 'index.html')
   size = parse.size_str(params['out_dir'])
@@ -113,6 +117,10 @@ class PeptagramForm(tkform.Form):
         'title', 'Title', 'Prophet Peptagram')
     self.push_labeled_param(
         'out_dir', 'Output directory', 'peptagram-prophet', load_dir_text='select directory')
+    self.push_checkbox_param(
+        'shard_proteins', 'Split proteins into separate files', init_val='0')
+    self.push_checkbox_param(
+        'pack_spectra', 'Pack MS/MS spectra as float32', init_val='0')
 
     self.push_spacer()
     self.push_line()
@@ -16,8 +16,8 @@ import tkFileDialog
 import tkform
 
 
-def load_data_jsonp(data_jsonp):
-    with open(data_jsonp) as f:
+def read_jsonp_args(jsonp):
+    with open(jsonp) as f:
       txt = f.read()
     i_bracket = txt.find('(')
     if i_bracket > 0:
@@ -25,7 +25,24 @@ def load_data_jsonp(data_jsonp):
     i_bracket = txt.rfind(')')
     if i_bracket > 0:
         txt = txt[:i_bracket]
-    return json.loads(txt)
+    return json.loads('[' + txt + ']')
+
+
+def load_data_jsonp(data_jsonp):
+    data = read_jsonp_args(data_jsonp)[0]
+    pep_dir = os.path.dirname(data_jsonp)
+    for seqid, protein in data['proteins'].items():
+      if 'shard' in protein:
+        shard_seqid, shard_protein = \
+            read_jsonp_args(os.path.join(pep_dir, protein['shard']))
+        protein['sources'] = shard_protein['sources']
+        del protein['shard']
+    peptagram.proteins.densify_sources(data['proteins'], data.get('n_source'))
+    peptagram.proteins.decolumnize_data(data)
+    peptagram.proteins.unpack_match_spectra(data['proteins'])
+    peptagram.proteins.expand_peptide_seqids(data)
+    peptagram.proteins.expand_scans(data)
+    return data
 
 
 class ResortPeptagramForm(tkform.Form):
@@ -56,6 +73,10 @@ class ResortPeptagramForm(tkform.Form):
         'title', 'peptagram title', 'Reordered Peptagram')
     self.push_labeled_param(
         'out_dir', 'output directory', 'peptagram-reordered', load_dir_text='select')
+    self.push_checkbox_param(
+        'shard_proteins', 'Split proteins into separate files', init_val='0')
+    self.push_checkbox_param(
+        'pack_spectra', 'Pack MS/MS spectra as float32', init_val='0')
 
     self.push_spacer()
     self.push_line()
@@ -163,7 +184,9 @@ class ResortPeptagramForm(tkform.Form):
 
     out_dir = os.path.abspath(params['out_dir'])
     peptagram.proteins.make_graphical_comparison_visualisation(
-        data, out_dir)
+        data, out_dir,
+        shard_proteins=params.get('shard_proteins', 0) != 0,
+        pack_spectra=params.get('pack_spectra', 0) != 0)
     self.print_output(
         'Successfully built peptagram webpage (%s):\n' % \
             parse.size_str(out_dir))
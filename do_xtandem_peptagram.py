@@ -27,6 +27,8 @@ test_params = {
   'cutoff_expect': 1E-2,
   'include_msms': 1,
   'match_filter': 3,
+  'shard_proteins': 0,
+  'pack_spectra': 0,
   'n_peak': 50,
 }
 
@@ -42,7 +44,6 @@ def convert_xtandem_to_peptagram(params, print_fn=sys.stdout.write):
   proteins = {}
   labels = []
   for fname, label in params['files_and_labels']:
-    labels.append(label)
     size = parse.size_str(fname)
     print_fn("Processing %s (%s)...\n" % (fname, size))
     these_proteins = peptagram.xtandem.get_proteins(
@@ -51,7 +52,8 @@ def convert_xtandem_to_peptagram(params, print_fn=sys.stdout.write):
         good_expect=great_expect,
         cutoff_expect=cutoff_expect)
     proteins = peptagram.proteins.merge_two_proteins(
-        proteins, these_proteins)
+        proteins, these_proteins, len(labels))
+    labels.append(label)
 
   peptagram.proteins.filter_proteins(proteins, params)
 
@@ -62,7 +64,9 @@ def convert_xtandem_to_peptagram(params, print_fn=sys.stdout.write):
       'color_names': [great_expect, cutoff_expect],
       'mask_labels': [],
       'out_dir': params['out_dir'],
-  })
+  },
+      shard_proteins=params.get('shard_proteins', 0) != 0,
+      pack_spectra=params.get('pack_spectra', 0) != 0)
 
   html = os.path.join(params['out_dir'], 'index.html')
   size = parse.size_str(params['out_dir'])
@@ -96,6 +100,10 @@ class PeptagramForm(tkform.Form):
         'title', 'Title', 'X!Tandem Peptagram')
     self.push_labeled_param(
         'out_dir', 'Output directory', 'peptagram-xtandem', load_dir_text='select directory')
+    self.push_checkbox_param(
+        'shard_proteins', 'Split proteins into separate files', init_val='0')
+    self.push_checkbox_param(
+        'pack_spectra', 'Pack MS/MS spectra as float32', init_val='0')
 
     self.push_spacer()
     self.push_line()
@@ -3,10 +3,20 @@
 from __future__ import print_function
 from pprint import pprint
 
+import os
+import re
+import json
 import math
+import mmap
 import urllib
+import multiprocessing
 import xml.etree.ElementTree as etree
 
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
 import logging
 
 logger = logging.getLogger('mascot')
@@ -29,7 +39,12 @@ Main API entry:
   get_proteins(
       mascot_dat, 
       great_score=80, 
-      cutoff_score=0)
+      cutoff_score=0,
+      is_lazy_queries=True,
+      n_worker=1,
+      scans=None,
+      include_spectrum=True,
+      i_source=0)
 
   returns a dictionary that organizes peptide-spectrum-matches
   around proteins, and a list of sources.
@@ -44,9 +59,151 @@ def splitter(s, delimiter, i, j=None):
     return str(s).split(delimiter)[i:j]
 
 
+boundary_regex = re.compile(r'^Content-Type:[^\n]*boundary=([^\s;]+)', re.M)
+
+content_type_regex = re.compile(
+    r'[^\n]*\n\s*Content-Type:[^\n]*name="?([^"\r\n]*)"?[^\n]*\n')
+
+
+def make_mascot_dat_index(mascot_dat):
+  """
+  Returns {'boundary': boundary, 'sections': [[name, start, end], ..]} 
+  where sections are the MIME sections of a Mascot .dat file in file 
+  order, and [start, end) the byte range of their content. The file
+  is searched with regexes over a memory map.
+  """
+  index = { 'boundary': None, 'sections': [] }
+  if os.path.getsize(mascot_dat) == 0:
+    return index
+  f = open(mascot_dat, 'rb')
+  data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  try:
+    match = boundary_regex.search(data)
+    if match is None:
+      return index
+    boundary = match.group(1)
+    index['boundary'] = boundary
+    separator_regex = re.compile('^--' + re.escape(boundary), re.M)
+    starts = [m.start() for m in separator_regex.finditer(data, match.end())]
+    for start, end in zip(starts, starts[1:] + [len(data)]):
+      match = content_type_regex.match(data, start)
+      if match is None or match.end() > end:
+        continue
+      index['sections'].append([match.group(1), match.end(), end])
+  finally:
+    data.close()
+    f.close()
+  return index
+
+
+def load_mascot_dat_index(mascot_dat):
+  """
+  Returns the index of make_mascot_dat_index, which is stored in
+  mascot_dat + '.index.json', and only rebuilt if the size or mtime
+  of the .dat file has changed.
+  """
+  index_json = mascot_dat + '.index.json'
+  stat = os.stat(mascot_dat)
+  try:
+    index = json.load(open(index_json))
+    if index['size'] == stat.st_size and index['mtime'] == stat.st_mtime:
+      return index
+  except (IOError, OSError, ValueError, KeyError):
+    pass
+  index = make_mascot_dat_index(mascot_dat)
+  index['size'] = stat.st_size
+  index['mtime'] = stat.st_mtime
+  try:
+    json.dump(index, open(index_json, 'w'))
+  except (IOError, OSError):
+    logger.warning('Could not save index of ' + mascot_dat)
+  return index
+
+
+def is_query_section(section):
+  return "query" in section
+
+
+def parse_ions1(s, use_numpy=True):
+  """
+  Returns the peaks of a Mascot Ions1 string 'mz:intensity,...' as an
+  (n, 2) float array converted in a single numpy call, or as a list of
+  [mz, intensity] if numpy is not available. Use get_spectrum to turn
+  either into output.
+  """
+  if use_numpy and np is not None:
+    values = np.array(s.replace(':', ',').split(','), dtype=float)
+    return values.reshape(-1, 2)
+  pairs = [piece.split(':') for piece in s.split(',')]
+  return [[float(x),float(y)] for x,y in pairs]
+
+
+def get_spectrum(peaks, n_peak=None):
+  """
+  Returns the peaks from parse_ions1 as a list of [mz, intensity] in
+  file order, or the n_peak most intense peaks if n_peak is given.
+  """
+  if n_peak is not None:
+    return parse_proteins.get_top_peaks(peaks, n_peak)
+  if hasattr(peaks, 'tolist'):
+    return peaks.tolist()
+  return peaks
+
+
+def parse_query_line(scan_id, query, l):
+  lhs, rhs = l.split("=")
+  if lhs in query:
+    raise ValueError(
+        "%s already in scans[%d]" % (lhs, scan_id))
+  if lhs == 'title':
+    query['title'] = urllib.unquote(rhs)
+  elif lhs == 'Ions1':
+    query['Ions1'] = parse_ions1(rhs)
+  else:
+    query[lhs] = parse_string(rhs)
+
+
+def read_section_lines(f, start, end):
+  "Returns the non-empty lines in a byte range of an open file"
+  f.seek(start)
+  return [l for l in f.read(end - start).split('\n') if l.strip()]
+
+
+def read_query_section(f, scan_id, start, end):
+  query = {}
+  for l in read_section_lines(f, start, end):
+    parse_query_line(scan_id, query, l)
+  return query
+
+
+def read_queries(args):
+  """
+  Returns {scan_id: query} where args = (mascot_dat, query_ranges),
+  query_ranges is a list of (scan_id, start, end), and a query is a
+  dictionary of the values in a query section. Used as a process 
+  pool worker.
+  """
+  mascot_dat, query_ranges = args
+  f = open(mascot_dat, 'rb')
+  queries = {}
+  for scan_id, start, end in query_ranges:
+    queries[scan_id] = read_query_section(f, scan_id, start, end)
+  f.close()
+  return queries
+
+
 class MascotReader():
-  def __init__(self, mascot_dat, max_peptide_rank=1):
+  """
+  Reads a Mascot .dat file into self.scans. If is_lazy_queries, the 
+  query sections, which hold the spectra, are not parsed, but their
+  byte ranges are stored in self.query_ranges, and a query section
+  can be read later with read_query.
+  """
+  def __init__(self, mascot_dat, max_peptide_rank=1, is_lazy_queries=False):
     self.mascot_dat = mascot_dat
+    self.is_lazy_queries = is_lazy_queries
+    self.query_ranges = {}
+    self.query_file = None
     self.scans = {}
     self.proteins = {}
     self.aa_mass = {}
@@ -63,44 +220,34 @@ class MascotReader():
     self.read_mascot_dat()
 
   def read_mascot_dat(self):
-    for l in open(self.mascot_dat):
-      if not l.strip():
-        continue
-
-      if not self.boundary_id:
-        if l.startswith("Content-Type") and 'boundary' in l:
-          self.boundary_id = "--" + splitter(l, "=", -1)
-          continue
-
-      if not self.boundary_id:
-        continue
-
-      if self.boundary_id and l.startswith(self.boundary_id):
-        self.section = None
-        self.process_line = None
-        continue
-
-      if l.startswith("Content-Type"):
-        word = splitter(l, None, -1)
-        name = splitter(word, "=", -1)
-        self.section = name[1:-1]
-        if self.section == "masses":
-          self.process_line = self.process_masses
-        if self.section == "unimod":
-          self.process_line = self.process_unimod
-        if self.section == "summary":
-          self.process_line = self.process_summary
-        if self.section in ['matches', 'peptides']:
-          self.process_line = self.process_matches
-        if "query" in self.section:
-          self.scan_id = int(self.section[5:])
+    index = load_mascot_dat_index(self.mascot_dat)
+    self.boundary_id = index['boundary']
+    f = open(self.mascot_dat, 'rb')
+    for section, start, end in index['sections']:
+      self.section = section
+      self.process_line = None
+      if section == "masses":
+        self.process_line = self.process_masses
+      if section == "unimod":
+        self.process_line = self.process_unimod
+      if section == "summary":
+        self.process_line = self.process_summary
+      if section in ['matches', 'peptides']:
+        self.process_line = self.process_matches
+      if is_query_section(section):
+        self.scan_id = int(section[5:])
+        if self.is_lazy_queries:
+          self.query_ranges[self.scan_id] = [start, end]
+        else:
           self.process_line = self.process_query
-        if self.section == "proteins":
-          self.process_line = self.process_proteins
-        continue
-
+      if section == "proteins":
+        self.process_line = self.process_proteins
       if self.process_line:
-        self.process_line(l[:-1])
+        for l in read_section_lines(f, start, end):
+          self.process_line(l)
+    self.section = None
+    self.process_line = None
+    f.close()
 
   def process_summary(self, l):
     i = None
@@ -223,38 +370,106 @@ class MascotReader():
       self.aa_mass[l] = float(r)
 
   def process_query(self, l):
-    lhs, rhs = l.split("=")
-    if lhs in self.scans[self.scan_id]:
-      raise ValueError(
-          "%s already in scans[%d]" % (lhs, self.scan_id))
-    if lhs == 'title':
-      self.scans[self.scan_id]['title'] = urllib.unquote(rhs)
-    elif lhs == 'Ions1':
-      pairs = [piece.split(':') for piece in rhs.split(',')]
-      ions = [[float(x),float(y)] for x,y in pairs]
-      self.scans[self.scan_id]['Ions1'] = ions
-    else:
-      self.scans[self.scan_id][lhs] = parse_string(rhs)
+    parse_query_line(self.scan_id, self.scans[self.scan_id], l)
+
+  def read_query(self, scan_id):
+    """
+    Returns a dictionary of the values in the query section of 
+    scan_id, read from the byte range found by read_mascot_dat.
+    """
+    start, end = self.query_ranges[scan_id]
+    if self.query_file is None:
+      self.query_file = open(self.mascot_dat, 'rb')
+    return read_query_section(self.query_file, scan_id, start, end)
+
+  def close(self):
+    if self.query_file is not None:
+      self.query_file.close()
+      self.query_file = None
+
 
 
+def get_scan_attr(scan):
+  attr = {}
+  for key in scan:
+    if key not in ["Ions1", "matches"]:
+      attr[key] = scan[key]
+  return attr
+
+
+def is_scan_accepted(scan, cutoff_score):
+  for mascot_match in scan['matches']:
+    if mascot_match['score'] >= cutoff_score:
+      return True
+  return False
+
 
 def get_proteins(
     mascot_dat, 
     great_score=80, 
-    cutoff_score=0):
-
-  mascot_reader = MascotReader(mascot_dat)
+    cutoff_score=0,
+    is_lazy_queries=True,
+    n_worker=1,
+    scans=None,
+    include_spectrum=True,
+    i_source=0,
+    n_peak=None):
+  """
+  If is_lazy_queries, the spectra of the .dat file are only read for 
+  scans that have a match that passes cutoff_score. With n_worker > 1,
+  these query sections are read in a pool of n_worker processes.
+
+  If a scans dictionary is given, the spectrum and attr of each scan
+  are stored once in scans['<i_source>:<query>'], and matches refer
+  to it with match['scan'], instead of holding their own copy. When
+  scans is shared between .dat files, each file needs its own 
+  i_source, as .dat files in different directories may share a 
+  basename.
+
+  Spectra keep all their peaks, unless n_peak is given, in which case
+  only the n_peak most intense peaks are kept.
+  """
+  mascot_reader = MascotReader(mascot_dat, is_lazy_queries=is_lazy_queries)
   aa_mass = mascot_reader.aa_mass
   modifications = mascot_reader.modifications
 
+  queries = {}
+  if is_lazy_queries and n_worker > 1:
+    query_ranges = []
+    for scan_id, scan in sorted(mascot_reader.scans.items()):
+      if is_scan_accepted(scan, cutoff_score):
+        start, end = mascot_reader.query_ranges[scan_id]
+        query_ranges.append((scan_id, start, end))
+    n_job = 4*n_worker
+    n_range = len(query_ranges)//n_job + 1
+    jobs = [
+        (mascot_dat, query_ranges[i:i+n_range])
+        for i in range(0, len(query_ranges), n_range)]
+    pool = multiprocessing.Pool(n_worker)
+    try:
+      for job_queries in pool.map(read_queries, jobs, chunksize=1):
+        queries.update(job_queries)
+    finally:
+      pool.close()
+      pool.join()
+
   proteins = {}
   for scan_id, scan in mascot_reader.scans.items():
+    if is_lazy_queries:
+      if not is_scan_accepted(scan, cutoff_score):
+        continue
+      if scan_id in queries:
+        query = queries.pop(scan_id)
+      else:
+        query = mascot_reader.read_query(scan_id)
+      scan = dict(scan)
+      scan.update(query)
+    spectrum = None
     for mascot_match in scan['matches']:
       peptide_sequence = mascot_match['sequence']
       match = parse_proteins.new_match(peptide_sequence)
       match['attr']['missed_cleavages'] = mascot_match['skip']
       match['ionscore'] = mascot_match['score']
-      match['spectrum'] = scan['Ions1']
       score = match['ionscore']
       if score < cutoff_score:
         continue
@@ -262,9 +477,19 @@ def get_proteins(
           parse_proteins.calc_intensity(
               score, great_score, cutoff_score)
       match['intensity'] = intensity
-      for key in scan:
-        if key not in ["Ions1", "matches"]:
-          match['attr'][key] = scan[key]
+      if include_spectrum and spectrum is None:
+        spectrum = get_spectrum(scan['Ions1'], n_peak)
+      if scans is None:
+        if include_spectrum:
+          match['spectrum'] = spectrum
+        match['attr'].update(get_scan_attr(scan))
+      else:
+        scan_key = '%d:%d' % (i_source, scan_id)
+        if scan_key not in scans:
+          scans[scan_key] = { 'attr': get_scan_attr(scan) }
+          if include_spectrum:
+            scans[scan_key]['spectrum'] = spectrum
+        match['scan'] = scan_key
       n = len(peptide_sequence)
       match['modifications'] = []
       for i_res in range(-1, n+1):
@@ -285,6 +510,7 @@ def get_proteins(
         protein = proteins[seqid]
         protein['sources'][0]['matches'].append(match)
 
+  mascot_reader.close()
   return proteins
 
 
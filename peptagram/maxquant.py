@@ -4,6 +4,8 @@ from __future__ import print_function
 from pprint import pprint
 
 import os
+import itertools
+import multiprocessing
 
 import logging
 
@@ -21,7 +23,10 @@ Main API entry:
   get_proteins_and_sources(
       in_dir,
       great_expect=1E-8, 
-      cutoff_expect=1E-2)
+      cutoff_expect=1E-2,
+      is_two_pass=False,
+      include_spectrum=True,
+      n_worker=1)
 
   returns a dictionary that organizes peptide-spectrum-matches
   around proteins, and a list of sources.
@@ -69,6 +74,28 @@ protein_parse_list = []
 #   ('ratio h/l variability [%]', float),
 # ]
 
+# columns of the summary files that are read as numbers,
+# all other columns are kept as strings
+
+evidence_tsv_parse_list = [
+  ('id', int),
+]
+
+protein_group_tsv_parse_list = [
+  ('id', int),
+]
+
+peptide_tsv_parse_list = [
+  ('id', int),
+]
+
+scan_tsv_parse_list = [
+  ('id', int),
+  ('evidence id', int),
+  ('peptide id', int),
+  ('pep', float),
+]
+
 scan_parse_list = [
   ('scan number', int),
   ('m/z', float),
@@ -80,6 +107,35 @@ scan_parse_list = [
 ]
 
 
+def get_keys(parse_list):
+  return [key for key, convert_fn in parse_list]
+
+
+# columns of the summary files that are read, all others are skipped
+
+evidence_tsv_keys = [
+  'id', 'raw file', 'modified sequence', 'mod. peptide id'
+] + get_keys(evidence_parse_list)
+
+protein_group_tsv_keys = [
+  'id', 'protein ids'
+] + get_keys(protein_parse_list)
+
+peptide_tsv_keys = [
+  'id', 'unique (groups)'
+] + get_keys(peptide_parse_list)
+
+# size in bytes of the chunks of msms.txt that are parsed in one go
+msms_chunk_size = 1 << 25
+
+spectrum_tsv_keys = ['masses', 'intensities', 'matches']
+
+scan_tsv_keys = [
+  'id', 'evidence id', 'peptide id', 'protein group ids', 'sequence', 
+  'modifications', 'modified sequence', 
+] + spectrum_tsv_keys + get_keys(scan_parse_list)
+
+
 def change_key(data, old_key, new_key):
   if not old_key in data or old_key == new_key:
     return
@@ -137,17 +193,113 @@ def get_modifications(scan):
   return modifications
 
 
+def make_scan_match(scan, great_expect, cutoff_expect, include_spectrum):
+  """
+  Returns the match of an accepted scan from msms.txt alone. The
+  evidence and peptide attrs are added by add_evidence_attrs.
+  """
+  match = {
+    'sequence': scan['sequence'],
+    'modifications': get_modifications(scan),
+    'intensity': parse_proteins.calc_minus_log_intensity(
+        scan['pep'], great_expect, cutoff_expect),
+    'attr' : {
+      'mq_scan_id': scan['id'],
+      'evidence_id': scan['evidence id'],
+    }
+  }
+  if include_spectrum:
+    match['spectrum'] = get_labeled_spectrum(scan)
+  transfer_attrs(scan, match['attr'], scan_parse_list)
+  change_key(match['attr'], 'scan number', 'scan_id')
+  change_key(match['attr'], 'retention time', 'retention_time')
+  return match
+
+
+def add_evidence_attrs(match, evidence, peptide):
+  match['attr']['modified_sequence'] = evidence['modified sequence']
+  match['attr']['is_unique'] = peptide['unique (groups)'] == 'yes'
+  transfer_attrs(evidence, match['attr'], evidence_parse_list)
+  transfer_attrs(peptide, match['attr'], peptide_parse_list)
+
+
+def read_scan_records(args):
+  """
+  Returns (n_scan, records) for the lines of msms.txt in byte_range,
+  where args = (scans_fname, byte_range, great_expect, cutoff_expect,
+  include_spectrum), and records is a list of (match, evidence_id, 
+  peptide_id, group_ids) for the accepted scans. Used as a process 
+  pool worker.
+  """
+  scans_fname, byte_range, great_expect, cutoff_expect, include_spectrum = args
+  scan_keys = scan_tsv_keys
+  if not include_spectrum:
+    scan_keys = [k for k in scan_keys if k not in spectrum_tsv_keys]
+  scans = parse.iter_tsv_rows(
+      scans_fname, scan_keys, scan_tsv_parse_list, byte_range=byte_range)
+  n_scan = 0
+  records = []
+  for scan in scans:
+    n_scan += 1
+    if scan['pep'] > cutoff_expect:
+      continue
+    match = make_scan_match(scan, great_expect, cutoff_expect, include_spectrum)
+    group_ids = map(int, parse.splitter(scan['protein group ids']))
+    records.append((match, scan['evidence id'], scan['peptide id'], group_ids))
+  return n_scan, records
+
+
+def get_accepted_ids(scans_fname, cutoff_expect):
+  """
+  Returns the sets of evidence ids and peptide ids of the scans 
+  in msms.txt that pass cutoff_expect.
+  """
+  evidence_ids = set()
+  peptide_ids = set()
+  scans = parse.iter_tsv_rows(
+      scans_fname, ['evidence id', 'peptide id', 'pep'], scan_tsv_parse_list)
+  for scan in scans:
+    if scan['pep'] <= cutoff_expect:
+      evidence_ids.add(scan['evidence id'])
+      peptide_ids.add(scan['peptide id'])
+  return evidence_ids, peptide_ids
+
+
 def get_proteins_and_sources(
     in_dir,
     great_expect=1E-8, 
-    cutoff_expect=1E-2):
+    cutoff_expect=1E-2,
+    is_two_pass=False,
+    include_spectrum=True,
+    n_worker=1):
+  """
+  If is_two_pass, msms.txt is first scanned for the evidence and
+  peptides of accepted scans, and only those rows are kept from 
+  evidence.txt and peptides.txt, which bounds memory by the number 
+  of accepted scans rather than the size of the tables. If not
+  include_spectrum, the spectra of msms.txt are not read. With
+  n_worker > 1, chunks of msms.txt are parsed in a pool of n_worker
+  processes, and the matches are attached in file order.
+  """
+  scans_fname = os.path.join(in_dir, 'msms.txt')
+  accepted_evidence_ids = None
+  accepted_peptide_ids = None
+  if is_two_pass:
+    logger.info('Finding accepted scans: ' + scans_fname)
+    accepted_evidence_ids, accepted_peptide_ids = \
+        get_accepted_ids(scans_fname, cutoff_expect)
 
   evidence_fname = os.path.join(in_dir, 'evidence.txt')
   logger.info('Loading evidence file: ' + evidence_fname)
-  evidence_iter = parse.read_tsv(evidence_fname)
-  evidence_dict = { int(e['id']):e for e in evidence_iter }
+  evidence_dict = {}
+  sources_set = set()
+  for evidence in parse.iter_tsv_rows(
+      evidence_fname, evidence_tsv_keys, evidence_tsv_parse_list):
+    sources_set.add(evidence['raw file'])
+    evidence_id = int(evidence['id'])
+    if accepted_evidence_ids is None or evidence_id in accepted_evidence_ids:
+      evidence_dict[evidence_id] = evidence
 
-  sources_set = set(e['raw file'] for e in evidence_dict.values())
   sources = [str(s) for s in sorted(sources_set)]
   i_sources = {source:k for k, source in enumerate(sources)}
 
@@ -155,7 +307,8 @@ def get_proteins_and_sources(
   logger.info('Loading protein groups: ' + protein_group_fname)
   proteins = {}
   protein_by_group_id = {}
-  for protein_group in parse.read_tsv(protein_group_fname):
+  for protein_group in parse.iter_tsv_rows(
+      protein_group_fname, protein_group_tsv_keys, protein_group_tsv_parse_list):
     group_id = protein_group['id']
     protein = {
       'description': '',
@@ -163,7 +316,7 @@ def get_proteins_and_sources(
         'group_id': group_id,
         'other_seqids': [],
       },
-      'sources': [{ 'matches': [] } for k in range(len(i_sources))],
+      'sources': {},
     }
     transfer_attrs(protein_group, protein['attr'], protein_parse_list)
 
@@ -175,53 +328,47 @@ def get_proteins_and_sources(
 
   peptides_fname = os.path.join(in_dir, 'peptides.txt')
   logger.info('Loading peptides file: ' + peptides_fname)
-  peptides_iter = parse.read_tsv(peptides_fname)
-  peptides = { int(p['id']):p for p in peptides_iter }
+  peptides = {}
+  for peptide in parse.iter_tsv_rows(
+      peptides_fname, peptide_tsv_keys, peptide_tsv_parse_list):
+    peptide_id = int(peptide['id'])
+    if accepted_peptide_ids is None or peptide_id in accepted_peptide_ids:
+      peptides[peptide_id] = peptide
 
-  scans_fname = os.path.join(in_dir, 'msms.txt')
   logger.info('Loading scans and matching: ' + scans_fname)
 
-  i_scan = 0
-  for scan in parse.read_tsv(scans_fname):
-    scan_id = int(scan['id'])
-    i_scan += 1
-    if i_scan % 5000 == 0:
-      logger.info("{} scans processed".format(i_scan))
-    evidence_id = int(scan['evidence id'])
-    evidence = evidence_dict[evidence_id]
-    mod_seq = evidence['modified sequence']
-    mod_peptide_id = evidence['mod. peptide id']
-
-    peptide_id = int(scan['peptide id'])
-    peptide = peptides[peptide_id]
-    for group_id in parse.splitter(str(scan['protein group ids'])):
-      match = {
-        'sequence': scan['sequence'],
-        'spectrum': get_labeled_spectrum(scan),
-        'modifications': get_modifications(scan),
-        'attr' : {
-          'modified_sequence': mod_seq,
-          'mq_scan_id': scan_id,
-          'evidence_id': evidence_id,
-          'is_unique': peptide['unique (groups)'] == 'yes',
-        }
-      }
-
-      if scan['pep'] > cutoff_expect:
-        continue
-        
-      match['intensity'] = parse_proteins.calc_minus_log_intensity(
-        scan['pep'], great_expect, cutoff_expect)
-
-      transfer_attrs(scan, match['attr'], scan_parse_list)
-      transfer_attrs(evidence, match['attr'], evidence_parse_list)
-      transfer_attrs(peptide, match['attr'], peptide_parse_list)
-      change_key(match['attr'], 'scan number', 'scan_id')
-      change_key(match['attr'], 'retention time', 'retention_time')
-      
-      protein = protein_by_group_id[int(group_id)]
-      i_source = i_sources[evidence['raw file']]
-      protein['sources'][i_source]['matches'].append(match)
+  n_chunk = max(n_worker, os.path.getsize(scans_fname)//msms_chunk_size + 1)
+  jobs = [
+      (scans_fname, byte_range, great_expect, cutoff_expect, include_spectrum)
+      for byte_range in parse.get_tsv_byte_ranges(scans_fname, n_chunk)]
+
+  pool = None
+  if n_worker <= 1:
+    results = itertools.imap(read_scan_records, jobs)
+  else:
+    pool = multiprocessing.Pool(n_worker)
+    results = pool.imap(read_scan_records, jobs)
+  try:
+    n_scan = 0
+    n_accepted = 0
+    for i_job, (n_job_scan, records) in enumerate(results):
+      n_scan += n_job_scan
+      n_accepted += len(records)
+      logger.info("{}/{} chunks of {}: {} scans processed, {} accepted".format(
+          i_job + 1, len(jobs), scans_fname, n_scan, n_accepted))
+      for scan_match, evidence_id, peptide_id, group_ids in records:
+        evidence = evidence_dict[evidence_id]
+        add_evidence_attrs(scan_match, evidence, peptides[peptide_id])
+        i_source = i_sources[evidence['raw file']]
+        for group_id in group_ids:
+          match = dict(scan_match)
+          match['attr'] = dict(scan_match['attr'])
+          protein = protein_by_group_id[group_id]
+          parse_proteins.get_source(protein, i_source)['matches'].append(match)
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
 
   parse_proteins.count_matches(proteins)
   parse_proteins.delete_empty_proteins(proteins)
@@ -33,9 +33,36 @@ Main API entry:
 """
 
 
+# columns of the tsv files that are read as numbers,
+# all other columns are kept as strings
+
+modification_tsv_parse_list = [
+  ('monoisotopic mass shift (da)', float),
+]
+
+protein_group_tsv_parse_list = [
+  ('summed morpheus score', float),
+]
+
+psm_tsv_parse_list = [
+  ('scan number', int),
+  ('spectrum number', int),
+  ('retention time (min)', float),
+  ('retention time (minutes)', float),
+  ('morpheus score', float),
+  ('precursor charge', int),
+  ('precursor mass (da)', float),
+  ('precursor mass error (da)', float),
+  ('precursor m/z', float),
+  ('missed cleavages', int),
+  ('q-value (%)', float),
+]
+
+
 def read_modification_dict(modifications_tsv):
   result = {}
-  for entry in parse.read_tsv(modifications_tsv):
+  entries = parse.read_tsv(modifications_tsv, modification_tsv_parse_list)
+  for entry in entries:
     key = entry['description']
     mass = float(entry['monoisotopic mass shift (da)'])
     if 'residue' in entry:
@@ -109,7 +136,7 @@ def make_protein(i_group, protein_group):
         'other_seqids': seqids[1:],
         'seqid': seqids[0],
       },
-      'sources': [{ 'matches':[] }]
+      'sources': {}
     }
     return protein
 
@@ -164,7 +191,7 @@ def make_match(psm, modification_table):
     return match
 
 
-def get_i_source(proteins, sources, source):
+def get_i_source(sources, source):
   for i_test_source, test_source in enumerate(sources):
     if source == test_source:
       i_source = i_test_source
@@ -172,9 +199,6 @@ def get_i_source(proteins, sources, source):
   else:
     i_source = len(sources)
     sources.append(source)
-    if i_source > 0:
-      for protein in proteins.values():
-        protein['sources'].append({ 'matches':[] })
   return i_source
 
 
@@ -195,7 +219,9 @@ def get_proteins_and_sources(
   
   proteins = {}
   dict_dump_writer = parse.DictListWriter(is_debug, os.path.join(dump_dir, 'protein_groups.dump'))
-  for i_group, protein_group in enumerate(parse.read_tsv(protein_groups_fname)):
+  protein_groups = parse.read_tsv(
+      protein_groups_fname, protein_group_tsv_parse_list)
+  for i_group, protein_group in enumerate(protein_groups):
     protein = make_protein(i_group, protein_group)
     proteins[protein['attr']['seqid']] = protein
     dict_dump_writer.dump_dict(protein_group)
@@ -214,7 +240,7 @@ def get_proteins_and_sources(
   n_match_assigned = 0
   i_source_from_source = {}
   sources = []
-  for psm in parse.read_tsv(psm_fname):
+  for psm in parse.read_tsv(psm_fname, psm_tsv_parse_list):
     dict_dump_writer.dump_dict(psm)
 
     match = make_match(psm, modification_table)
@@ -242,8 +268,8 @@ def get_proteins_and_sources(
     match['i'] = sequence.find(peptide_sequence)
 
     n_match_assigned += 1
-    i_source = get_i_source(proteins, sources, psm['filename'])
-    protein['sources'][i_source]['matches'].append(match)
+    i_source = get_i_source(sources, psm['filename'])
+    parse_proteins.get_source(protein, i_source)['matches'].append(match)
 
   dict_dump_writer.close()
 
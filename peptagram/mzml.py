@@ -3,30 +3,134 @@
 from __future__ import print_function
 from pprint import pprint
 
+import logging
+import multiprocessing
+
+logger = logging.getLogger('mzml')
+
 import pymzml
 
+import proteins as proteins_module
+
 
 """
 Loads specific MS-MS spectra from an mzML file into 
 an existing proteins data structure.
 """
 
-def load_mzml_into_matches(matches, mzml, n_peak=50):
-  get_scan_id = lambda match: match['attr']['scan_id']
-  match_by_scan_id = {get_scan_id(m): m for m in matches}
 
-  for spectrum in pymzml.run.Reader(mzml):
-    if spectrum['id'] in match_by_scan_id:
-      match = match_by_scan_id[spectrum['id']]
-      ions = [(mz, i) for mz, i in spectrum.peaks]
-      ions.sort(key=lambda i:-i[1])
-      match['spectrum'] = ions[:n_peak]
+def get_top_ions(spectrum, n_peak):
+  return proteins_module.get_top_peaks(spectrum.peaks, n_peak)
+
+
+def iterate_spectra(run, scan_ids):
+  """
+  Yields (scan_id, spectrum) for the given scan_ids in run. Indexed mzML
+  files are read through the offset index in sorted order, only seeking
+  to the wanted spectra, else the whole file is streamed.
+  """
+  offsets = run.info['offsets']
+  if run.info['seekable'] and len(run.info['offsetList']) > 0:
+    for scan_id in sorted(scan_ids):
+      if scan_id not in offsets:
+        logger.debug('Scan {} not in {}'.format(scan_id, run.info['filename']))
+        continue
+      yield scan_id, run[scan_id]
+  else:
+    for spectrum in run:
+      if spectrum['id'] in scan_ids:
+        yield spectrum['id'], spectrum
+
+
+def group_matches_by_scan_id(matches):
+  matches_by_scan_id = {}
+  for match in matches:
+    scan_id = match['attr']['scan_id']
+    if scan_id not in matches_by_scan_id:
+      matches_by_scan_id[scan_id] = []
+    matches_by_scan_id[scan_id].append(match)
+  return matches_by_scan_id
+
+
+def read_top_ions(args):
+  """
+  Returns {scan_id: top n_peak ions} for the scan_ids in an mzML file,
+  where args = (mzml, scan_ids, n_peak, index_gzip, cache_offsets). 
+  Used as a process pool worker so it only sends back the peaks that
+  are kept. Gzipped files are streamed, unless index_gzip, where 
+  their offsets are indexed for random access. If cache_offsets, the
+  offset index is cached in '<mzml>.offsets' next to the file.
+  """
+  mzml, scan_ids, n_peak, index_gzip, cache_offsets = args
+  run = pymzml.run.Reader(
+      mzml, indexGzip=index_gzip, offsetCache=cache_offsets, useNumpy=True)
+  ions_by_scan_id = {}
+  for scan_id, spectrum in iterate_spectra(run, set(scan_ids)):
+    ions_by_scan_id[scan_id] = get_top_ions(spectrum, n_peak)
+  return ions_by_scan_id
+
 
+def set_match_spectra(matches_by_scan_id, ions_by_scan_id):
+  for scan_id, ions in ions_by_scan_id.items():
+    for match in matches_by_scan_id[scan_id]:
+      match['spectrum'] = ions
 
-def load_mzml(proteins, i_source, mzml, n_peak=50):
+
+def load_mzml_into_matches(
+    matches, mzml, n_peak=50, index_gzip=False, cache_offsets=False):
+  matches_by_scan_id = group_matches_by_scan_id(matches)
+  ions_by_scan_id = read_top_ions(
+      (mzml, list(matches_by_scan_id), n_peak, index_gzip, cache_offsets))
+  set_match_spectra(matches_by_scan_id, ions_by_scan_id)
+
+
+def get_source_matches(proteins, i_source):
   matches = []
   for protein in proteins.values():
-    matches.extend(protein['sources'][i_source]['matches'])
-  load_mzml_into_matches(matches, mzml, n_peak)
+    matches.extend(proteins_module.get_matches(protein, i_source))
+  return matches
+
+
+def load_mzml(
+    proteins, i_source, mzml, n_peak=50, index_gzip=False, 
+    cache_offsets=False):
+  matches = get_source_matches(proteins, i_source)
+  load_mzml_into_matches(matches, mzml, n_peak, index_gzip, cache_offsets)
+
+
+def load_mzmls(
+    proteins, i_source_mzmls, n_peak=50, n_worker=None, index_gzip=False,
+    cache_offsets=False):
+  """
+  Loads spectra for a list of (i_source, mzml) pairs, one mzML file
+  per process in a pool of at most n_worker processes (default: the
+  number of cpus). Results are merged in the order of i_source_mzmls.
+  """
+  matches_by_scan_id_list = []
+  jobs = []
+  for i_source, mzml in i_source_mzmls:
+    matches_by_scan_id = group_matches_by_scan_id(
+        get_source_matches(proteins, i_source))
+    matches_by_scan_id_list.append(matches_by_scan_id)
+    jobs.append(
+        (mzml, sorted(matches_by_scan_id), n_peak, index_gzip, cache_offsets))
+
+  if n_worker is None:
+    n_worker = multiprocessing.cpu_count()
+  n_worker = min(n_worker, len(jobs))
+  if n_worker <= 1:
+    results = map(read_top_ions, jobs)
+  else:
+    pool = multiprocessing.Pool(n_worker)
+    try:
+      results = pool.map(read_top_ions, jobs, chunksize=1)
+    finally:
+      pool.close()
+      pool.join()
+
+  for (i_source, mzml), matches_by_scan_id, ions_by_scan_id in \
+      zip(i_source_mzmls, matches_by_scan_id_list, results):
+    logger.debug('Loaded {} spectra from {}'.format(len(ions_by_scan_id), mzml))
+    set_match_spectra(matches_by_scan_id, ions_by_scan_id)
 
 
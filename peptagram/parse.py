@@ -10,6 +10,20 @@ import glob
 import logging
 import ntpath, posixpath, macpath
 
+try:
+  import xml.etree.cElementTree as etree
+except ImportError:
+  import xml.etree.ElementTree as etree
+
+try:
+  import lxml.etree as lxml_etree
+except ImportError:
+  lxml_etree = None
+
+# lxml is opt-in: on the pepXML benchmark in benchmark.py, the stdlib
+# cElementTree parser is faster
+use_lxml = False
+
 
 """
 Utility parsing functions for strings and files.
@@ -47,9 +61,12 @@ def basename(fname):
   return fname
 
 
+int_regex = re.compile(r'^[-+]?\d+$')
+
+
 def parse_string(s):
   "Converts a string to a float or int if matches numerical pattern"
-  if re.search(r'^[-+]?\d+$', s):
+  if int_regex.match(s):
     return int(s)
   elif float_regex.match(s):
     return float(s)
@@ -75,20 +92,162 @@ def split_tab(line):
   return line.split('\t')
 
 
-def read_tsv(tsv_txt):
+tsv_buffer_size = 1 << 20
+
+
+class TsvRow(object):
+  """
+  A row of a TSV file: a tuple of values, and a {key: i} header
+  index that is shared by all the full rows of the file, so that
+  values can be looked up by key as in a dictionary.
+  """
+  __slots__ = ('values', 'index')
+
+  def __init__(self, values, index):
+    self.values = values
+    self.index = index
+
+  def __getitem__(self, key):
+    return self.values[self.index[key]]
+
+  def __contains__(self, key):
+    return key in self.index
+
+  def get(self, key, default=None):
+    if key in self.index:
+      return self.values[self.index[key]]
+    return default
+
+  def keys(self):
+    return sorted(self.index, key=self.index.get)
+
+  def items(self):
+    return zip(self.keys(), self.values)
+
+  def __repr__(self):
+    return 'TsvRow(%r)' % dict(self.items())
+
+
+def get_tsv_byte_ranges(tsv_txt, n_range):
+  """
+  Returns a list of at most n_range (start, end) byte offsets that 
+  split the lines after the title line of a TSV file into chunks
+  of about equal size, where every chunk starts on a new line.
+  """
+  size = os.path.getsize(tsv_txt)
+  f = open(tsv_txt, "rb")
+  try:
+    f.readline()
+    starts = [f.tell()]
+    for i in range(1, n_range):
+      pos = starts[0] + (size - starts[0])*i//n_range
+      if pos <= starts[-1]:
+        continue
+      f.seek(pos - 1)
+      f.readline()
+      pos = f.tell()
+      if starts[-1] < pos < size:
+        starts.append(pos)
+  finally:
+    f.close()
+  ends = starts[1:] + [size]
+  return zip(starts, ends)
+
+
+def iter_byte_range_lines(f, start, end):
+  "Yields the lines of a binary file that start in [start, end)"
+  f.seek(start)
+  pos = start
+  while pos < end:
+    line = f.readline()
+    if not line:
+      break
+    pos += len(line)
+    if line.endswith('\r\n'):
+      line = line[:-2] + '\n'
+    yield line
+
+
+def get_tsv_conversions(index, parse_list):
+  "Returns [(i, convert_fn)] of the keys of parse_list found in index"
+  conversions = []
+  if parse_list:
+    for key, convert_fn in parse_list:
+      if key in index:
+        conversions.append((index[key], convert_fn))
+  return conversions
+
+
+def iter_tsv_rows(
+    tsv_txt, keys=None, parse_list=None, buffer_size=tsv_buffer_size,
+    byte_range=None):
+  """
+  Reads a title top TSV file line by line, and yields a TsvRow
+  for every non-empty line. Keys are lower case. If keys is given,
+  only those columns are kept. If parse_list of (key, convert_fn) 
+  is given, those columns are converted, and all other values, as
+  well as empty cells, are left as strings. Lines that are shorter
+  than the title line only have the keys of the cells they hold. If
+  byte_range = (start, end), from get_tsv_byte_ranges, only the lines
+  in that range are read.
+  """
+  if byte_range is None:
+    f = open(tsv_txt, "UR", buffer_size)
+    lines = f
+  else:
+    f = open(tsv_txt, "rb", buffer_size)
+  try:
+    titles = [w.lower() for w in split_tab(f.readline().replace('\r', ''))]
+    if byte_range is not None:
+      lines = iter_byte_range_lines(f, byte_range[0], byte_range[1])
+    i_column_by_title = {title: i for i, title in enumerate(titles)}
+    if keys is None:
+      i_columns = sorted(i_column_by_title.values())
+    else:
+      i_columns = [i_column_by_title[k] for k in keys if k in i_column_by_title]
+    index = {titles[i]: j for j, i in enumerate(i_columns)}
+    conversions = get_tsv_conversions(index, parse_list)
+    n_title = len(titles)
+    for line in lines:
+      words = split_tab(line)
+      if len(words) < n_title:
+        if len(words) == 1 and not words[0].strip():
+          continue
+        # the missing cells of a short row are left out of its keys
+        row_columns = [i for i in i_columns if i < len(words)]
+        row_index = {titles[i]: j for j, i in enumerate(row_columns)}
+        row_conversions = get_tsv_conversions(row_index, parse_list)
+      else:
+        row_columns = i_columns
+        row_index = index
+        row_conversions = conversions
+      values = [words[i] for i in row_columns]
+      for j, convert_fn in row_conversions:
+        if values[j] != '':
+          values[j] = convert_fn(values[j])
+      yield TsvRow(tuple(values), row_index)
+  finally:
+    f.close()
+
+
+def read_tsv(tsv_txt, parse_list=None, keys=None):
   """
   Reads a title top TSV file, converts all keys to lower case
-  and returns a list of dictionaries.
-  """
-  f = open(tsv_txt, "UR")
-  titles = [w.lower() for w in split_tab(f.readline())]
-  results = []
-  for line in f.readlines():
-    group = {}
-    for key, val in zip(titles, split_tab(line)):
-      group[key] = parse_string(val)
+  and returns a list of dictionaries. If parse_list of 
+  (key, convert_fn) is given, only those columns are converted,
+  and all other values are left as strings. If keys is given,
+  only those columns are read.
+  """
+  row_index = None
+  for row in iter_tsv_rows(tsv_txt, keys, parse_list):
+    if row.index is not row_index:
+      row_index = row.index
+      row_keys = row.keys()
+    group = dict(zip(row_keys, row.values))
+    if parse_list is None:
+      for key in group:
+        group[key] = parse_string(group[key])
     yield group
-    del group
 
 
 # XML helper functions
@@ -98,11 +257,96 @@ def fixtag(ns, tag, nsmap):
   return '{' + nsmap[ns] + '}' + tag
 
 
-def parse_attrib(elem):
-  "Returns a Python dictionary from an xml attrib dict"
-  result = {}
-  for key, value in elem.attrib.items():
-    result[key] = parse_string(value)
+def get_namespace(tag):
+  "Returns the namespace uri of a '{uri}tag' element tag, or ''"
+  if tag.startswith('{'):
+    return tag[1:tag.index('}')]
+  return ''
+
+
+def get_local_tag(tag):
+  "Returns the tag with any '{uri}' namespace prefix removed"
+  return tag.rsplit('}', 1)[-1]
+
+
+class NamespaceTags(dict):
+  """
+  Maps local tag names to the full '{uri}tag' form of one
+  namespace, resolving each tag only once.
+  """
+  def __init__(self, namespace=''):
+    dict.__init__(self)
+    self.namespace = namespace
+
+  def __missing__(self, tag):
+    if self.namespace:
+      full_tag = '{' + self.namespace + '}' + tag
+    else:
+      full_tag = tag
+    self[tag] = full_tag
+    return full_tag
+
+
+def iterparse(fname, events=('end',), tags=None):
+  """
+  Yields (event, elem) for elements whose local tag is in tags, in
+  any namespace. Uses the stdlib cElementTree, or lxml, which does
+  the tag filtering in C, if use_lxml is set and lxml is available.
+  """
+  if use_lxml and lxml_etree is not None:
+    kwargs = {}
+    if tags:
+      kwargs['tag'] = ['{*}' + tag for tag in tags]
+    for event, elem in lxml_etree.iterparse(
+        fname, events=events, huge_tree=True, **kwargs):
+      yield event, elem
+  else:
+    if not tags:
+      for event, elem in etree.iterparse(fname, events=events):
+        yield event, elem
+      return
+    tags = set(tags)
+    is_selected_by_tag = {}
+    for event, elem in etree.iterparse(fname, events=events):
+      is_selected = is_selected_by_tag.get(elem.tag)
+      if is_selected is None:
+        is_selected = get_local_tag(elem.tag) in tags
+        is_selected_by_tag[elem.tag] = is_selected
+      if is_selected:
+        yield event, elem
+
+
+def clear_element(elem, parent=None):
+  """
+  Frees the children of an element that has been processed. Under
+  lxml, also drops the already-processed siblings that lxml keeps
+  attached to the parent. Stdlib elements don't know their parent,
+  so if parent is given, its children, which must all have been 
+  processed, are dropped instead.
+  """
+  elem.clear()
+  if hasattr(elem, 'getprevious'):
+    while elem.getprevious() is not None:
+      del elem.getparent()[0]
+  elif parent is not None:
+    del parent[:]
+
+
+def parse_attrib(elem, parse_list=None):
+  """
+  Returns a Python dictionary from an xml attrib dict. If parse_list
+  of (key, convert_fn) is given, only those keys are converted, and
+  all other values are left as strings.
+  """
+  if parse_list is None:
+    result = {}
+    for key, value in elem.attrib.items():
+      result[key] = parse_string(value)
+    return result
+  result = dict(elem.attrib)
+  for key, convert_fn in parse_list:
+    if key in result:
+      result[key] = convert_fn(result[key])
   return result
 
 
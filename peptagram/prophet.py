@@ -3,7 +3,13 @@
 from __future__ import print_function
 from pprint import pprint
 
-import xml.etree.ElementTree as etree
+import bisect
+import multiprocessing
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
 
 import logging
 
@@ -70,13 +76,131 @@ def probability_to_error(distribution, prob):
   return None
 
 
+class DistributionLookup(object):
+  """
+  A False-Positive-Error vs. Probability distribution, sorted by
+  error, compiled into lists for bisect lookups that interpolate
+  exactly as error_to_probability and probability_to_error. If the
+  probabilities do not fall with error, lookups use the linear scans.
+  """
+
+  # below this batch size, numpy overhead beats bisect
+  n_min_vectorized = 64
+
+  def __init__(self, distribution):
+    self.distribution = distribution
+    self.errors = [d['error'] for d in distribution]
+    self.probs = [d['prob'] for d in distribution]
+    self.minus_probs = [-p for p in self.probs]
+    self.n = len(distribution)
+    self.is_error_sorted = all(
+        e0 <= e1 for e0, e1 in zip(self.errors, self.errors[1:]))
+    self.is_prob_sorted = all(
+        p0 <= p1 for p0, p1 in zip(self.minus_probs, self.minus_probs[1:]))
+
+  def error_to_probability(self, error):
+    if not self.is_error_sorted:
+      return error_to_probability(self.distribution, error)
+    i = bisect.bisect_right(self.errors, error)
+    if i == 0 or i == self.n:
+      return None
+    f = fractionate(self.errors[i-1], self.errors[i], error)
+    return interpolate(self.probs[i-1], self.probs[i], f)
+
+  def find_prob_interval(self, prob):
+    # first i with probs[i-1] >= prob >= probs[i], or None
+    i = bisect.bisect_left(self.minus_probs, -prob)
+    if i == self.n:
+      return None
+    if i == 0:
+      if self.n < 2 or self.minus_probs[0] != -prob:
+        return None
+      i = 1
+    return i
+
+  def probability_to_error(self, prob):
+    if not self.is_prob_sorted:
+      return probability_to_error(self.distribution, prob)
+    i = self.find_prob_interval(prob)
+    if i is None:
+      return None
+    f = fractionate(self.probs[i-1], self.probs[i], prob)
+    return interpolate(self.errors[i-1], self.errors[i], f)
+
+  def probabilities_to_errors(self, probs):
+    """
+    Returns the list of errors for a batch of probabilities, with
+    None for probabilities outside the distribution. Large batches
+    are interpolated with numpy if available.
+    """
+    if np is None or not self.is_prob_sorted or \
+        len(probs) < self.n_min_vectorized or self.n < 2:
+      return [self.probability_to_error(prob) for prob in probs]
+    minus_probs = np.array(self.minus_probs)
+    x = np.array(probs, dtype=float)
+    i = np.searchsorted(minus_probs, -x, side='left')
+    is_found = (i < self.n) & ((i > 0) | (minus_probs[0] == -x))
+    i = np.clip(i, 1, self.n - 1)
+    probs0 = -minus_probs[i-1]
+    probs1 = -minus_probs[i]
+    if np.any(is_found & (probs0 == probs1)):
+      # keep the ZeroDivisionError of the scalar interpolation
+      return [self.probability_to_error(prob) for prob in probs]
+    errors = np.array(self.errors)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      f = (x - probs0)/(probs1 - probs0)
+      result = errors[i-1] + f*(errors[i] - errors[i-1])
+    return [float(e) if found else None for e, found in zip(result, is_found)]
+
+
+# only the numeric attributes are converted, with parse_string as
+# before, so that e.g. probability="1" still reads as an int
+spectrum_query_parse_list = [
+  ('index', parse.parse_string),
+  ('start_scan', parse.parse_string),
+  ('end_scan', parse.parse_string),
+  ('assumed_charge', parse.parse_string),
+  ('precursor_neutral_mass', parse.parse_string),
+  ('retention_time_sec', parse.parse_string),
+]
+
+search_hit_parse_list = [
+  ('hit_rank', parse.parse_string),
+  ('num_tot_proteins', parse.parse_string),
+  ('num_matched_ions', parse.parse_string),
+  ('tot_num_ions', parse.parse_string),
+  ('num_missed_cleavages', parse.parse_string),
+  ('num_tol_term', parse.parse_string),
+  ('is_rejected', parse.parse_string),
+  ('calc_neutral_pep_mass', parse.parse_string),
+  ('massdiff', parse.parse_string),
+  ('protein_mw', parse.parse_string),
+  ('calc_pI', parse.parse_string),
+]
+
+mod_aminoacid_mass_parse_list = [
+  ('position', parse.parse_string),
+  ('mass', parse.parse_string),
+]
+
+peptideprophet_result_parse_list = [
+  ('probability', parse.parse_string),
+]
+
+error_point_parse_list = [
+  ('error', parse.parse_string),
+  ('min_prob', parse.parse_string),
+]
+
+
 class PepxmlReader(object):
   def __init__(self, pepxml):
     self.pepxml = pepxml
     self.distribution = None
+    self.lookup = None
     self.source_names = []
     self.i_source = None
-    self.nsmap = {}
+    self.tags = None
     self.is_debug = logger.root.level <= logging.DEBUG
 
   def __iter__(self):
@@ -85,19 +209,24 @@ class PepxmlReader(object):
       logger.debug('Dumping pepxml reads into ' + fname)
       self.debug_file = open(fname, 'w')
       self.debug_file.write('[\n')
-    for event, elem in etree.iterparse(self.pepxml, events=('start', 'end', 'start-ns')):
-      if event == 'start-ns':
-        self.nsmap.update({elem})
-      elif event == 'start':
-        if elem.tag == self.search_tag('msms_run_summary'):
+    elems = parse.iterparse(
+        self.pepxml, 
+        events=('start', 'end'), 
+        tags=['msms_run_summary', 'spectrum_query', 'peptideprophet_summary'])
+    for event, elem in elems:
+      if self.tags is None:
+        self.tags = parse.NamespaceTags(parse.get_namespace(elem.tag))
+      if event == 'start':
+        if elem.tag == self.tags['msms_run_summary']:
           fname = elem.attrib['base_name']
           self.source_names.append(fname)
           self.i_source = len(self.source_names) - 1
       elif event == 'end':
-        if elem.tag == self.search_tag('spectrum_query'):
+        if elem.tag == self.tags['spectrum_query']:
           scan = self.parse_scan(elem)
-          for match in scan['matches']:
-            fpe = probability_to_error(self.distribution, match['probability'])
+          fpes = self.lookup.probabilities_to_errors(
+              [match['probability'] for match in scan['matches']])
+          for match, fpe in zip(scan['matches'], fpes):
             if fpe is None:
               logger.warning("WTF", match['probability'], self.distribution)
             else:
@@ -108,29 +237,30 @@ class PepxmlReader(object):
             pprint(scan, stream=self.debug_file)
             self.debug_file.write(',\n')
           yield scan
-          elem.clear()
-        elif elem.tag == self.search_tag('peptideprophet_summary'):
+          parse.clear_element(elem)
+        elif elem.tag == self.tags['peptideprophet_summary']:
           self.parse_peptide_probabilities(elem)
           if self.distribution[0]['prob'] < 1.0:
             self.distribution.insert(0, {'prob':1.0, 'error':0.0})
           if self.distribution[-1]['prob'] > 0.0:
             self.distribution.append({'prob':0.0, 'error':1.0})
+          self.lookup = DistributionLookup(self.distribution)
           if self.is_debug:
             fname = self.pepxml + '.distribution.dump'
             pprint(self.distribution, open(fname, 'w'))
-          elem.clear()
+          parse.clear_element(elem)
     if self.is_debug:
       self.debug_file.write(']\n')
       self.debug_file.close()
 
   def search_tag(self, tag):
-    return parse.fixtag('', tag, self.nsmap)
+    return self.tags[tag]
 
   def findall(self, elem, tag):
-    return elem.findall(self.search_tag(tag))
+    return elem.findall(self.tags[tag])
 
   def find(self, elem, tag):
-    return elem.find(self.search_tag(tag))
+    return elem.find(self.tags[tag])
 
   def parse_peptide_probabilities(self, elem):
     # try with error_point
@@ -143,7 +273,7 @@ class PepxmlReader(object):
           break
     self.distribution = []
     for elem in error_points:
-        attrib = parse.parse_attrib(elem)
+        attrib = parse.parse_attrib(elem, error_point_parse_list)
         self.distribution.append({
           'error': attrib['error'],
           'prob': attrib['min_prob'],
@@ -153,49 +283,95 @@ class PepxmlReader(object):
     logger.info('Peptide probability cutoff for 0.01 fpe: %f' % peptide_probability) 
 
   def parse_scan(self, scan_elem):
-    scan = parse.parse_attrib(scan_elem)
+    tags = self.tags
+    scan = parse.parse_attrib(scan_elem, spectrum_query_parse_list)
     scan['matches'] = []
-    for search_elem in self.findall(scan_elem, "search_result"):
+    for search_elem in scan_elem.findall(tags['search_result']):
       search_hit_elem = search_elem[0] 
-      pepxml_match = parse.parse_attrib(search_hit_elem)
+      pepxml_match = parse.parse_attrib(search_hit_elem, search_hit_parse_list)
       pepxml_match['modified_sequence'] = pepxml_match['peptide']
 
       pepxml_match['other_seqids'] = []
-      for alt_protein in self.findall(search_hit_elem, 'alternative_protein'):
+      for alt_protein in search_hit_elem.findall(tags['alternative_protein']):
         pepxml_match['other_seqids'].append(alt_protein.attrib['protein'])
 
       pepxml_match['modifications'] = []
-      for modified_elem in self.findall(search_hit_elem, 'modification_info'):
-        attr = parse.parse_attrib(modified_elem)
-        pepxml_match['modified_sequence'] = attr['modified_peptide']
-        for modification_elem in self.findall(modified_elem, 'mod_aminoacid_mass'):
-          attr = parse.parse_attrib(modification_elem)
+      for modified_elem in search_hit_elem.findall(tags['modification_info']):
+        pepxml_match['modified_sequence'] = modified_elem.attrib['modified_peptide']
+        for modification_elem in modified_elem.findall(tags['mod_aminoacid_mass']):
+          attr = parse.parse_attrib(
+              modification_elem, mod_aminoacid_mass_parse_list)
           attr['i'] = attr['position'] - 1
           del attr['position']
           pepxml_match['modifications'].append(attr)
 
-      for score_elem in self.findall(search_hit_elem, 'search_score'):
-        pepxml_match.update(parse.parse_name_value(score_elem))
+      for score_elem in search_hit_elem.findall(tags['search_score']):
+        attrib = score_elem.attrib
+        pepxml_match[attrib['name']] = parse.parse_string(attrib['value'])
 
-      for analysis_elem in self.find(search_hit_elem, 'analysis_result'):
-        if analysis_elem.tag == self.search_tag('peptideprophet_result'):
-          pepxml_match.update(parse.parse_attrib(analysis_elem))
+      for analysis_elem in search_hit_elem.find(tags['analysis_result']):
+        if analysis_elem.tag == tags['peptideprophet_result']:
+          pepxml_match.update(parse.parse_attrib(
+              analysis_elem, peptideprophet_result_parse_list))
           for param_elem in analysis_elem[0]:
-            pepxml_match.update(parse.parse_name_value(param_elem))
+            attrib = param_elem.attrib
+            pepxml_match[attrib['name']] = parse.parse_string(attrib['value'])
 
       scan['matches'].append(pepxml_match)
 
     return scan
 
 
+protein_group_parse_list = [
+  ('group_number', parse.parse_string),
+  ('probability', parse.parse_string),
+  ('pseudo_name', parse.parse_string),
+]
+
+protein_parse_list = [
+  ('probability', parse.parse_string),
+  ('percent_coverage', parse.parse_string),
+  ('n_indistinguishable_proteins', parse.parse_string),
+  ('total_number_peptides', parse.parse_string),
+  ('total_number_distinct_peptides', parse.parse_string),
+  ('pct_spectrum_ids', parse.parse_string),
+  ('confidence', parse.parse_string),
+  ('length', parse.parse_string),
+]
+
+# protxml peptides are carried into the output, so all numeric
+# attributes are converted
+peptide_parse_list = [
+  ('charge', parse.parse_string),
+  ('initial_probability', parse.parse_string),
+  ('nsp_adjusted_probability', parse.parse_string),
+  ('fpkm_adjusted_probability', parse.parse_string),
+  ('ni_adjusted_probability', parse.parse_string),
+  ('weight', parse.parse_string),
+  ('n_enzymatic_termini', parse.parse_string),
+  ('n_sibling_peptides', parse.parse_string),
+  ('n_sibling_peptides_bin', parse.parse_string),
+  ('exp_sibling_ion_instances', parse.parse_string),
+  ('exp_sibling_ion_bin', parse.parse_string),
+  ('n_ions', parse.parse_string),
+  ('n_instances', parse.parse_string),
+  ('exp_tot_instances', parse.parse_string),
+  ('calc_neutral_pep_mass', parse.parse_string),
+]
+
+protein_summary_data_filter_parse_list = [
+  ('false_positive_error_rate', parse.parse_string),
+  ('min_probability', parse.parse_string),
+]
+
+
 class ProtxmlReader(object):
   def __init__(self, protxml):
     self.protxml = protxml
     self.distribution = None
-    self.nsmap = {}
     self.debug_file = None
     self.is_debug = logger.root.level <= logging.DEBUG
-    self.nsmap = {}
+    self.tags = None
 
   def __iter__(self):
     if self.is_debug:
@@ -203,40 +379,44 @@ class ProtxmlReader(object):
       logger.debug('Dumping protxml reads into ' + fname)
       self.debug_file = open(fname, 'w')
       self.debug_file.write('{\n')
-    for event, elem in etree.iterparse(self.protxml, events=('end', 'start-ns')):
-      if event == 'start-ns':
-        self.nsmap.update({elem})
-      if event == 'end':
-        if elem.tag == self.search_tag('protein_group'):
-          group = self.parse_protein_group(elem)
-          yield group
-          if self.is_debug:
-            pprint(group, stream=self.debug_file)
-            self.debug_file.write(',\n')
-          elem.clear()
-        elif elem.tag == self.search_tag('proteinprophet_details'):
-          self.parse_protein_probabilities(elem)
-          if self.is_debug:
-            fname = self.protxml + '.distribution.dump'
-            pprint(self.distribution, open(fname, 'w'))
-          elem.clear()
+    elems = parse.iterparse(
+        self.protxml, 
+        events=('end',), 
+        tags=['protein_group', 'proteinprophet_details'])
+    for event, elem in elems:
+      if self.tags is None:
+        self.tags = parse.NamespaceTags(parse.get_namespace(elem.tag))
+      if elem.tag == self.tags['protein_group']:
+        group = self.parse_protein_group(elem)
+        yield group
+        if self.is_debug:
+          pprint(group, stream=self.debug_file)
+          self.debug_file.write(',\n')
+        parse.clear_element(elem)
+      elif elem.tag == self.tags['proteinprophet_details']:
+        self.parse_protein_probabilities(elem)
+        if self.is_debug:
+          fname = self.protxml + '.distribution.dump'
+          pprint(self.distribution, open(fname, 'w'))
+        parse.clear_element(elem)
     if self.is_debug:
       self.debug_file.write('}\n')
       self.debug_file.close()
 
   def search_tag(self, tag):
-    return parse.fixtag('', tag, self.nsmap)
+    return self.tags[tag]
 
   def findall(self, elem, tag):
-    return elem.findall(self.search_tag(tag))
+    return elem.findall(self.tags[tag])
 
   def find(self, elem, tag):
-    return elem.find(self.search_tag(tag))
+    return elem.find(self.tags[tag])
 
   def parse_protein_probabilities(self, elem):
     self.distribution = []
     for data_point in self.findall(elem, 'protein_summary_data_filter'):
-      attrib = parse.parse_attrib(data_point)
+      attrib = parse.parse_attrib(
+          data_point, protein_summary_data_filter_parse_list)
       self.distribution.append({
         'error': attrib['false_positive_error_rate'],
         'prob': attrib['min_probability'],
@@ -244,23 +424,24 @@ class ProtxmlReader(object):
     self.distribution.sort(key=lambda d:d['error'])
 
   def parse_protein_group(self, elem):
-    group = parse.parse_attrib(elem)
+    tags = self.tags
+    group = parse.parse_attrib(elem, protein_group_parse_list)
     group['proteins'] = []
-    for protein_elem in self.findall(elem, 'protein'):
-      protein = parse.parse_attrib(protein_elem)
+    for protein_elem in elem.findall(tags['protein']):
+      protein = parse.parse_attrib(protein_elem, protein_parse_list)
       protein['group_number'] = group['group_number']
 
-      for parameter_elem in self.findall(protein_elem, 'parameter'):
+      for parameter_elem in protein_elem.findall(tags['parameter']):
         key = parameter_elem.attrib['name']
         val = parameter_elem.attrib['value']
         protein[key] = val
 
-      annotation_elem = self.find(protein_elem, 'annotation')
+      annotation_elem = protein_elem.find(tags['annotation'])
       if annotation_elem is not None:
         protein['description'] = annotation_elem.attrib['protein_description']
 
       protein['other_seqids'] = []
-      for alt_protein in self.findall(protein_elem, 'indistinguishable_protein'):
+      for alt_protein in protein_elem.findall(tags['indistinguishable_protein']):
         protein['other_seqids'].append(alt_protein.attrib['protein_name'])
 
       protein['other_seqids'] = protein['other_seqids']
@@ -268,16 +449,16 @@ class ProtxmlReader(object):
 
       protein['peptides'] = []
       n_unique_peptide = 0
-      for peptide_elem in self.findall(protein_elem, 'peptide'):
-        peptide = parse.parse_attrib(peptide_elem)
+      for peptide_elem in protein_elem.findall(tags['peptide']):
+        peptide = parse.parse_attrib(peptide_elem, peptide_parse_list)
         protein['peptides'].append(peptide)
         peptide['modifications'] = []
         peptide['modified_sequence'] = peptide['peptide_sequence']
-        for modified_elem in self.findall(peptide_elem, 'modification_info'):
-          attr = parse.parse_attrib(modified_elem)
-          peptide['modified_sequence'] = attr['modified_peptide']
-          for modification_elem in self.findall(modified_elem, 'mod_aminoacid_mass'):
-            attr = parse.parse_attrib(modification_elem)
+        for modified_elem in peptide_elem.findall(tags['modification_info']):
+          peptide['modified_sequence'] = modified_elem.attrib['modified_peptide']
+          for modification_elem in modified_elem.findall(tags['mod_aminoacid_mass']):
+            attr = parse.parse_attrib(
+                modification_elem, mod_aminoacid_mass_parse_list)
             peptide['modifications'].append(attr)
 
       group['proteins'].append(protein)
@@ -304,7 +485,7 @@ def make_proteins_from_protxml(protxml):
           'probability': protxml_protein['probability'],
           'percent_coverage': '-',
         },
-        'sources': [],
+        'sources': {},
       }
       if 'percent_coverage' in protxml_protein:
         protein['attr']['percent_coverage'] = protxml_protein['percent_coverage']
@@ -357,21 +538,53 @@ def make_match(pepxml_match, pepxml_scan, source):
   return match
 
 
-def load_pepxml_into_proteins(
-    proteins, 
-    pepxml_fname, 
-    prob_cutoff=None, 
-    error_cutoff=None, 
-    source_names=[],
+def make_protxml_peptide_index(proteins):
+  """
+  Returns {(protein seqid, charge, modified_sequence): (probability,
+  is_contributing_evidence)} of the protxml peptides of proteins; the
+  last of any duplicate peptides wins.
+  """
+  index = {}
+  for protein in proteins.values():
+    protein_seqid = protein['attr']['seqid']
+    for protxml_peptide in protein['protxml_peptides']:
+      key = (
+          protein_seqid,
+          protxml_peptide['charge'],
+          protxml_peptide['modified_sequence'])
+      index[key] = (
+          protxml_peptide['nsp_adjusted_probability'],
+          protxml_peptide['is_contributing_evidence'])
+  return index
+
+
+def get_canonical_seqids(proteins):
+  "Returns {seqid: protein seqid} that includes the alternative seqids"
+  canonical_seqids = {}
+  for seqid, protein in get_protein_by_seqid(proteins).items():
+    canonical_seqids[seqid] = protein['attr']['seqid']
+  return canonical_seqids
+
+
+def read_pepxml_match_tables(
+    pepxml_fname,
+    canonical_seqids,
+    protxml_peptide_index,
+    error_cutoff=None,
     good_expect=1E-8,
     cutoff_expect=1E-2,
     poor_expect=1E-2):
+  """
+  Reads the accepted matches of a pepxml without touching proteins,
+  so it can run in a worker process.
 
+  Returns the source names of the pepxml and, for each of these
+  sources, a table {protein seqid: [matches]} in file order.
+  """
   logger.info('Peptide error cutoff: {}'.format(error_cutoff))
-  protein_by_seqid = get_protein_by_seqid(proteins)
-  n_source = len(proteins.values()[0]['sources'])
   pepxml_reader = PepxmlReader(pepxml_fname)
-  source_name_indices = {}
+  tables = []
+  scan_ids_by_key = {}
   for scan in pepxml_reader:
     for pepxml_match in scan['matches']:
 
@@ -383,33 +596,34 @@ def load_pepxml_into_proteins(
 
       for seqid in seqids:
 
-        if seqid not in protein_by_seqid:
+        if seqid not in canonical_seqids:
           logger.warning('{} from scan {} not found in protxml'.format(seqid, scan['index']))
           continue
 
-        protein = protein_by_seqid[seqid]
+        protein_seqid = canonical_seqids[seqid]
 
-        if scan['source'] in source_name_indices:
-          i_source = source_name_indices[scan['source']]
-        else:
-          for protein in proteins.values():
-            protein['sources'].append({'matches': []})
-          n_source += 1
-          i_source = n_source-1
-          source_name_indices[scan['source']] = i_source
+        i_source = pepxml_reader.source_names.index(scan['source'])
+        while len(tables) <= i_source:
+          tables.append({})
 
-        matches = protein['sources'][i_source]['matches']
         scan_id = scan['start_scan']
-        scan_ids = [m['attr']['scan_id'] for m in matches]
+        key = (protein_seqid, i_source)
+        if key not in scan_ids_by_key:
+          scan_ids_by_key[key] = set()
+        scan_ids = scan_ids_by_key[key]
 
         if scan_id not in scan_ids:
           match = make_match(pepxml_match, scan, scan['source'])
 
-          for protxml_peptide in protein['protxml_peptides']:
-            if protxml_peptide['charge'] == scan['assumed_charge'] and \
-                protxml_peptide['modified_sequence'] == pepxml_match['modified_sequence']:  
-              match['attr']['probability_protxml'] = protxml_peptide['nsp_adjusted_probability']
-              match['attr']['is_contributing_evidence'] = protxml_peptide['is_contributing_evidence']
+          peptide_key = (
+              protein_seqid,
+              scan['assumed_charge'],
+              pepxml_match['modified_sequence'])
+          if peptide_key in protxml_peptide_index:
+            probability, is_contributing_evidence = \
+                protxml_peptide_index[peptide_key]
+            match['attr']['probability_protxml'] = probability
+            match['attr']['is_contributing_evidence'] = is_contributing_evidence
 
           assert match['attr']['probability'] == pepxml_match['probability']
 
@@ -425,9 +639,67 @@ def load_pepxml_into_proteins(
               parse_proteins.calc_minus_log_intensity(
                   pepxml_match['expect'], good_expect, poor_expect)
 
-          matches.append(match)
+          table = tables[i_source]
+          if protein_seqid not in table:
+            table[protein_seqid] = []
+          table[protein_seqid].append(match)
+          scan_ids.add(scan_id)
 
-  source_names.extend(pepxml_reader.source_names)
+  while len(tables) < len(pepxml_reader.source_names):
+    tables.append({})
+  return pepxml_reader.source_names, tables
+
+
+def merge_pepxml_match_tables(proteins, source_names, new_source_names, tables):
+  """
+  Adds the tables from read_pepxml_match_tables to the sparse sources
+  of proteins, numbered after the sources in source_names.
+  """
+  n_source = len(source_names)
+  for i_source, table in enumerate(tables):
+    for protein_seqid, matches in table.items():
+      source = parse_proteins.get_source(proteins[protein_seqid], n_source + i_source)
+      source['matches'].extend(matches)
+  source_names.extend(new_source_names)
+
+
+def load_pepxml_into_proteins(
+    proteins, 
+    pepxml_fname, 
+    prob_cutoff=None, 
+    error_cutoff=None, 
+    source_names=[],
+    good_expect=1E-8,
+    cutoff_expect=1E-2,
+    poor_expect=1E-2):
+  new_source_names, tables = read_pepxml_match_tables(
+      pepxml_fname,
+      get_canonical_seqids(proteins),
+      make_protxml_peptide_index(proteins),
+      error_cutoff=error_cutoff,
+      good_expect=good_expect,
+      cutoff_expect=cutoff_expect,
+      poor_expect=poor_expect)
+  merge_pepxml_match_tables(proteins, source_names, new_source_names, tables)
+
+
+# read-only tables shared with the pool workers of get_proteins_and_sources
+worker_tables = {}
+
+
+def init_pepxml_worker(canonical_seqids, protxml_peptide_index):
+  worker_tables['canonical_seqids'] = canonical_seqids
+  worker_tables['protxml_peptide_index'] = protxml_peptide_index
+
+
+def read_pepxml_job(args):
+  pepxml_fname, kwargs = args
+  logger.info('Loading pepxml ' + pepxml_fname)
+  return read_pepxml_match_tables(
+      pepxml_fname,
+      worker_tables['canonical_seqids'],
+      worker_tables['protxml_peptide_index'],
+      **kwargs)
 
 
 def count_independent_spectra(proteins):
@@ -436,7 +708,7 @@ def count_independent_spectra(proteins):
     n_unique_peptide = 0
     n_unique_spectrum = 0
     unique_sequence_set = set()
-    for source in protein['sources']:
+    for source in parse_proteins.iter_sources(protein):
       for peptide in source['matches']:
         sequence = str(peptide['attr']['charge']) + peptide['attr']['modified_sequence']
         if 'is_contributing_evidence' in peptide['attr'] and peptide['attr']['is_contributing_evidence'] == 'Y':
@@ -465,24 +737,43 @@ def get_proteins_and_sources(
     peptide_error=0.01, 
     protein_error=0.01,
     good_expect=1E-8,
-    cutoff_expect=1E-2):
+    cutoff_expect=1E-2,
+    n_worker=1):
   """
   Returns a proteins dictionary and list of source names.
+
+  With n_worker > 1, the pepxmls are read in a pool of up to n_worker
+  processes, and merged in the order of pepxmls, which gives the same
+  result as reading them one after another.
   """
 
   logger.info('Loading protxml ' + protxml)
   proteins, protein_probs = make_proteins_from_protxml(protxml)
 
+  canonical_seqids = get_canonical_seqids(proteins)
+  protxml_peptide_index = make_protxml_peptide_index(proteins)
+  kwargs = {
+    'error_cutoff': peptide_error,
+    'good_expect': good_expect,
+    'cutoff_expect': cutoff_expect,
+  }
+  jobs = [(pepxml, kwargs) for pepxml in pepxmls]
+  n_worker = min(n_worker, len(jobs))
+  init_pepxml_worker(canonical_seqids, protxml_peptide_index)
+  if n_worker <= 1:
+    results = map(read_pepxml_job, jobs)
+  else:
+    pool = multiprocessing.Pool(
+        n_worker, init_pepxml_worker, (canonical_seqids, protxml_peptide_index))
+    try:
+      results = pool.map(read_pepxml_job, jobs, chunksize=1)
+    finally:
+      pool.close()
+      pool.join()
+
   source_names = []
-  for pepxml in pepxmls:
-    logger.info('Loading pepxml ' + pepxml)
-    load_pepxml_into_proteins(
-      proteins, 
-      pepxml, 
-      error_cutoff=peptide_error, 
-      source_names=source_names,
-      good_expect=good_expect,
-      cutoff_expect=cutoff_expect)
+  for new_source_names, tables in results:
+    merge_pepxml_match_tables(proteins, source_names, new_source_names, tables)
     
   count_independent_spectra(proteins)
 
@@ -9,6 +9,10 @@ import json
 import copy
 import glob
 import shutil
+import struct
+import base64
+import heapq
+from operator import itemgetter
 from pprint import pprint
 
 import logging
@@ -59,17 +63,88 @@ def new_match(peptide_sequence):
   }
 
 
+def enumerate_sources(protein):
+  """
+  Yields (i_source, source) of protein. protein['sources'] is either
+  a list, or a sparse dict {i_source: source} that only holds sources
+  that have been given matches.
+  """
+  sources = protein['sources']
+  if isinstance(sources, dict):
+    for i_source in sorted(sources, key=int):
+      yield int(i_source), sources[i_source]
+  else:
+    for i_source, source in enumerate(sources):
+      yield i_source, source
+
+
+def iter_sources(protein):
+  for i_source, source in enumerate_sources(protein):
+    yield source
+
+
+def get_source(protein, i_source):
+  "Returns source i_source of protein, allocated on demand if sparse"
+  sources = protein['sources']
+  if isinstance(sources, dict) and i_source not in sources:
+    sources[i_source] = {'matches': []}
+  return sources[i_source]
+
+
+def get_matches(protein, i_source):
+  "Returns the matches of source i_source of protein, without allocating"
+  sources = protein['sources']
+  if isinstance(sources, dict) and i_source not in sources:
+    return []
+  return sources[i_source]['matches']
+
+
+def has_sparse_sources(proteins):
+  for protein in proteins.values():
+    if isinstance(protein['sources'], dict):
+      return True
+  return False
+
+
+def get_n_source(proteins):
+  n_source = 0
+  for protein in proteins.values():
+    sources = protein['sources']
+    if isinstance(sources, dict):
+      for i_source in sources:
+        n_source = max(n_source, int(i_source) + 1)
+    else:
+      n_source = max(n_source, len(sources))
+  return n_source
+
+
+def densify_sources(proteins, n_source=None):
+  """
+  Converts sparse sources in proteins into lists of n_source sources,
+  filling the gaps with empty sources.
+  """
+  if n_source is None:
+    n_source = get_n_source(proteins)
+  for protein in proteins.values():
+    if not isinstance(protein['sources'], dict):
+      continue
+    sources = [{'matches': []} for i_source in range(n_source)]
+    for i_source, source in enumerate_sources(protein):
+      sources[i_source] = source
+    protein['sources'] = sources
+
+
 def match_iterator(proteins):
   for seqid in proteins:
     protein = proteins[seqid]
-    for source in protein['sources']:
+    for source in iter_sources(protein):
       for match in source['matches']:
         yield seqid, match
 
 
 def do_matches(proteins, do_match_fn):
   for protein in proteins.values():
-    for source in protein['sources']:
+    for source in iter_sources(protein):
       for match in source['matches']:
         do_match_fn(match)
 
@@ -104,7 +179,7 @@ def count_matches(proteins):
 
     seqs = set()
 
-    for source in protein['sources']:
+    for source in iter_sources(protein):
       matches = source['matches']
       n_match += len(matches)
       if len(matches) > 0:
@@ -125,11 +200,10 @@ def count_matches(proteins):
     if 'sequence' in protein:
       sequence = protein['sequence']
       residues = set()
-      for source in protein['sources']:
-        matches = source['matches']
-      for m in matches:
-        for j in range(m['i'], m['i'] + len(seq)):
-          residues.add(j)
+      for source in iter_sources(protein):
+        for m in source['matches']:
+          for j in range(m['i'], m['i'] + len(m['sequence'])):
+            residues.add(j)
       protein['attr']['coverage'] = \
         "%.1f" % (100.0*len(residues)/float(len(sequence)))
 
@@ -138,7 +212,7 @@ def delete_empty_proteins(proteins):
   for seqid in proteins.keys():
     protein = proteins[seqid]
     n_match = 0
-    for source in protein['sources']:
+    for source in iter_sources(protein):
       n_match += len(source['matches'])
     if n_match == 0:
       del proteins[seqid]
@@ -149,9 +223,35 @@ def delete_spectrum(match):
     del match['spectrum']
 
 
+def get_top_peaks(peaks, n_peak):
+  """
+  Returns the n_peak most intense peaks as a list of (mz, intensity)
+  floats, most intense first, with ties kept in input order. peaks is
+  an iterable of (mz, intensity) pairs or a numpy (n, 2) array, such
+  as from xtandem.get_peaks, which is partitioned instead of sorted.
+  Either way the result is a plain list that can be written as JSON.
+  """
+  if not hasattr(peaks, 'argsort'):
+    top_peaks = heapq.nlargest(n_peak, peaks, key=itemgetter(1))
+    return [(float(mz), float(intensity)) for mz, intensity in top_peaks]
+  intensities = peaks[:, 1]
+  n = len(intensities)
+  if n > n_peak > 0:
+    partitioned = intensities.copy()
+    partitioned.partition(n - n_peak)
+    kth = partitioned[n - n_peak]
+    i_top = (intensities > kth).nonzero()[0]
+    i_equal = (intensities == kth).nonzero()[0][:n_peak - len(i_top)]
+    i_top = sorted(list(i_top) + list(i_equal))
+  else:
+    i_top = range(n if n_peak > 0 else 0)
+  i_top = sorted(i_top, key=lambda i: -intensities[i])
+  return [(float(peaks[i, 0]), float(intensities[i])) for i in i_top]
+
+
 def delete_matches(proteins, is_deleteable_fn):
   for protein in proteins.values():
-    for source in protein['sources']:
+    for source in iter_sources(protein):
       matches = source['matches']
       n_match = len(matches)
       for i_match in reversed(range(n_match)):
@@ -194,16 +294,40 @@ def calc_minus_log_intensity(x, high, low):
     -math.log(low))
 
 
-def find_peptide_positions_in_proteins(proteins):
+def find_peptide_positions_in_proteins(proteins, peptide_seqids=None):
+  """
+  Records the other proteins that share the peptide of each match.
+
+  By default, each match gets its own list in attr['other_seqids'].
+  If a peptide_seqids list is given, the seqids of each shared peptide
+  are interned once into peptide_seqids, and matches refer to their
+  entry with match['i_peptide_seqids'], so that the cost scales with
+  the number of distinct peptides rather than matches x sharers.
+  """
   protein_list = proteins.values()
   if len(protein_list) == 0:
     return
-  n_source = len(protein_list[0]['sources'])
+  if peptide_seqids is not None:
+    seqids_by_sequence = {}
+    for seqid, match in match_iterator(proteins):
+      sequence = match['sequence']
+      if sequence not in seqids_by_sequence:
+        seqids_by_sequence[sequence] = set()
+      seqids_by_sequence[sequence].add(seqid)
+    i_by_sequence = {}
+    for seqid, match in match_iterator(proteins):
+      sequence = match['sequence']
+      if len(seqids_by_sequence[sequence]) < 2:
+        continue
+      if sequence not in i_by_sequence:
+        i_by_sequence[sequence] = len(peptide_seqids)
+        peptide_seqids.append(sorted(seqids_by_sequence[sequence]))
+      match['i_peptide_seqids'] = i_by_sequence[sequence]
+    return
   seqids_by_sequence = {}
   for seqid in proteins:
     protein = proteins[seqid]
-    for i_source in range(n_source):
-      source = protein['sources'][i_source]
+    for source in iter_sources(protein):
       matches = source['matches']
       for match in matches:
         sequence = match['sequence']
@@ -212,9 +336,7 @@ def find_peptide_positions_in_proteins(proteins):
         seqids_by_sequence[sequence].add(seqid)
   for seqid in proteins:
     protein = proteins[seqid]
-    for i_source in range(n_source):
-      protein = proteins[seqid]
-      source = protein['sources'][i_source]
+    for source in iter_sources(protein):
       matches = source['matches']
       for match in matches:
         sequence = match['sequence']
@@ -225,6 +347,63 @@ def find_peptide_positions_in_proteins(proteins):
             match['attr']['other_seqids'].append(test_seqid)
 
 
+def delete_unused_scans(data):
+  "Deletes the entries of data['scans'] that no match refers to"
+  if 'scans' not in data:
+    return
+  scan_keys = set()
+  for seqid, match in match_iterator(data['proteins']):
+    if 'scan' in match:
+      scan_keys.add(match['scan'])
+  scans = data['scans']
+  for scan_key in scans.keys():
+    if scan_key not in scan_keys:
+      del scans[scan_key]
+
+
+def expand_scans(data):
+  """
+  Copies the spectrum and attr of the shared data['scans'] entries
+  into each match that refers to one with match['scan'], and removes
+  the scan table.
+  """
+  if 'scans' not in data:
+    return
+  scans = data['scans']
+  for scan in scans.values():
+    if isinstance(scan.get('spectrum'), basestring):
+      labels = scan.pop('spectrum_labels', None)
+      scan['spectrum'] = unpack_spectrum(scan['spectrum'], labels)
+  for seqid, match in match_iterator(data['proteins']):
+    if 'scan' not in match:
+      continue
+    scan = scans[match['scan']]
+    if 'spectrum' in scan:
+      match['spectrum'] = scan['spectrum']
+    for key, value in scan['attr'].items():
+      if key not in match['attr']:
+        match['attr'][key] = value
+    del match['scan']
+  del data['scans']
+
+
+def expand_peptide_seqids(data):
+  """
+  Converts the shared data['peptide_seqids'] references made by
+  find_peptide_positions_in_proteins back into attr['other_seqids']
+  of each match.
+  """
+  if 'peptide_seqids' not in data:
+    return
+  peptide_seqids = data['peptide_seqids']
+  for seqid, match in match_iterator(data['proteins']):
+    if 'i_peptide_seqids' in match:
+      seqids = peptide_seqids[match['i_peptide_seqids']]
+      match['attr']['other_seqids'] = [s for s in seqids if s != seqid]
+      del match['i_peptide_seqids']
+  del data['peptide_seqids']
+
+
 def change_seqids_in_proteins(proteins, clean_seqid):
   seqids = proteins.keys()
   for seqid in seqids:
@@ -241,36 +420,110 @@ def change_seqids_in_proteins(proteins, clean_seqid):
         proteins[new_seqid]['attr']['seqid'] = new_seqid
 
 
-def calculate_peptide_positions(proteins, iso_leu_isomerism=False):
-  for seqid in proteins:
+class PeptideLocator(object):
+  """
+  Locates peptides in the protein sequences of a proteins dictionary.
+  Each protein sequence, and each distinct peptide, is normalized 
+  once, with I/L isomerism folded in, and each distinct peptide is 
+  searched in a protein only once - the position is then reused for
+  every match that shares the peptide.
+  """
+  def __init__(self, proteins, iso_leu_isomerism=False):
+    self.iso_leu_isomerism = iso_leu_isomerism
+    self.sequences = {}
+    for seqid in proteins:
+      self.sequences[seqid] = self.normalize(proteins[seqid]['sequence'])
+    self.peptides = {}
+    self.positions = {}
+
+  def normalize(self, sequence):
+    if self.iso_leu_isomerism:
+      return sequence.replace("L", "I")
+    return sequence
+
+  def find(self, seqid, peptide_sequence):
+    "Returns the first position of peptide_sequence in seqid, or -1"
+    positions = self.positions.setdefault(seqid, {})
+    if peptide_sequence not in positions:
+      if peptide_sequence not in self.peptides:
+        self.peptides[peptide_sequence] = self.normalize(peptide_sequence)
+      positions[peptide_sequence] = \
+          self.sequences[seqid].find(self.peptides[peptide_sequence])
+    return positions[peptide_sequence]
+
+  def place_matches(self, seqid, matches):
+    """
+    Sets match['i'] to the first position of each match in seqid, 
+    and deletes the matches that are not found. Same as find, inlined
+    for the loop over all matches.
+    """
+    sequence = self.sequences[seqid]
+    positions = self.positions.setdefault(seqid, {})
+    peptides = self.peptides
+    iso_leu_isomerism = self.iso_leu_isomerism
+    for i_match in reversed(range(len(matches))):
+      match = matches[i_match]
+      peptide_sequence = match['sequence']
+      if peptide_sequence in positions:
+        i = positions[peptide_sequence]
+      else:
+        peptide = peptide_sequence
+        if iso_leu_isomerism:
+          if peptide_sequence not in peptides:
+            peptides[peptide_sequence] = self.normalize(peptide_sequence)
+          peptide = peptides[peptide_sequence]
+        i = sequence.find(peptide)
+        positions[peptide_sequence] = i
+      if i < 0:
+        logger.debug("'{}' not found in {}".format(peptide_sequence, seqid))
+        del matches[i_match]
+        continue
+      match['i'] = i 
+
+
+def calculate_peptide_positions(
+    proteins, iso_leu_isomerism=False, seqids=None):
+  if seqids is None:
+    seqids = proteins.keys()
+  locator = PeptideLocator(
+      {seqid: proteins[seqid] for seqid in seqids}, iso_leu_isomerism)
+  for seqid in seqids:
     protein = proteins[seqid]
-    protein_sequence = protein['sequence']
-    if iso_leu_isomerism:
-      protein_sequence = protein_sequence.replace("L", "I")
-    for source in protein['sources']:
+    for source in iter_sources(protein):
       matches = source['matches']
-      for i_match in reversed(range(len(matches))):
-        match = matches[i_match]
-        peptide_sequence = match['sequence']
-        if iso_leu_isomerism:
-          peptide_sequence = peptide_sequence.replace("L", "I")
-        i = protein_sequence.find(peptide_sequence)
-        if i < 0:
-          logger.debug("'{}' not found in {}".format(peptide_sequence, seqid))
-          del matches[i_match]
-          continue
-        match['i'] = i 
+      locator.place_matches(seqid, matches)
       for match in matches:
         if 'i' not in match:
           pprint(match)
           raise ValueError
 
 
+def is_placed_in_sequence(protein, sequence):
+  """
+  Returns True if every match of protein already has 'i' set to the
+  first position of its peptide in sequence.
+  """
+  first_positions = {}
+  for source in iter_sources(protein):
+    for match in source['matches']:
+      peptide_sequence = match['sequence']
+      i = match.get('i', -1)
+      if peptide_sequence not in first_positions:
+        first_positions[peptide_sequence] = sequence.find(
+            peptide_sequence, 0, max(i, 0) + len(peptide_sequence))
+      if i < 0 or first_positions[peptide_sequence] != i:
+        return False
+  return True
+
+
 def load_fastas_into_proteins(
     proteins, fastas, clean_seqid=None, iso_leu_isomerism=False):
   if clean_seqid:
     change_seqids_in_proteins(proteins, clean_seqid)
     change_seqids_in_proteins(fastas, clean_seqid)
+  # only proteins with a new sequence, or matches that are not
+  # already placed in that sequence, need their peptides located again
+  changed_seqids = []
   for seqid in proteins.keys():
     protein = proteins[seqid]
     if seqid not in fastas:
@@ -278,10 +531,14 @@ def load_fastas_into_proteins(
       del proteins[seqid]
       continue
     protein_sequence = fastas[seqid]['sequence']
+    if iso_leu_isomerism or \
+        protein.get('sequence') != protein_sequence or \
+        not is_placed_in_sequence(protein, protein_sequence):
+      changed_seqids.append(seqid)
     protein['description'] = fastas[seqid]['description']
     protein['sequence'] = protein_sequence
     protein['attr']['length'] = len(protein_sequence)
-  calculate_peptide_positions(proteins, iso_leu_isomerism)
+  calculate_peptide_positions(proteins, iso_leu_isomerism, changed_seqids)
 
 
 def load_fasta_db_into_proteins(
@@ -290,16 +547,33 @@ def load_fasta_db_into_proteins(
   load_fastas_into_proteins(proteins, fastas, clean_seqid, iso_leu_isomerism)
 
 
-def merge_two_proteins(proteins1, proteins2):
+def merge_two_proteins(proteins1, proteins2, n_source1):
   """
   Merges two proteins structures. In particular, it grafts the
   'sources' together, treating the sources in each proteins as 
   distinct, and maintaing the order.
+
+  n_source1 is the number of sources of proteins1, by which the 
+  sources of proteins2 are shifted. It can't be read off proteins1,
+  as trailing sources may have no matches.
   """
-  if len(proteins1) == 0:
+  if len(proteins1) == 0 and n_source1 == 0:
     return proteins2
-  seqid = proteins1.keys()[0]
-  n_source1 = len(proteins1[seqid]['sources'])
+  if has_sparse_sources(proteins1) or has_sparse_sources(proteins2):
+    for seqid, protein2 in proteins2.items():
+      sources2 = {}
+      for i_source, source in enumerate_sources(protein2):
+        sources2[n_source1 + i_source] = source
+      if seqid in proteins1:
+        protein1 = proteins1[seqid]
+        sources1 = dict(enumerate_sources(protein1))
+        sources1.update(sources2)
+        protein1['sources'] = sources1
+      else:
+        protein2['sources'] = sources2
+        proteins1[seqid] = protein2
+    return proteins1
+  n_source2 = 0
   if len(proteins2) > 0:
     seqid = proteins2.keys()[0]
     n_source2 = len(proteins2[seqid]['sources'])
@@ -321,21 +595,280 @@ def merge_two_proteins(proteins1, proteins2):
   return proteins1
 
 
-def save_data_js(data, js_fname):
+def write_data_json(data, f):
+  """
+  Writes data as JSON into the open file f. Proteins are serialized
+  one at a time so that the full JSON string of data is never held
+  in memory.
+  """
+  f.write('{')
+  for i_key, key in enumerate(data):
+    if i_key > 0:
+      f.write(', ')
+    f.write(json.dumps(key) + ': ')
+    if key != 'proteins':
+      f.write(json.dumps(data[key], indent=None))
+      continue
+    f.write('{')
+    for i_seqid, seqid in enumerate(data['proteins']):
+      if i_seqid > 0:
+        f.write(', ')
+      f.write(json.dumps(seqid) + ': ')
+      f.write(json.dumps(data['proteins'][seqid], indent=None))
+    f.write('}')
+  f.write('}')
+
+
+def save_data_js(data, js_fname, is_stream=False):
   f = open(js_fname, 'w')
   f.write('var data = \n')
-  f.write(json.dumps(data, indent=None))
+  if is_stream:
+    write_data_json(data, f)
+  else:
+    f.write(json.dumps(data, indent=None))
   f.close()
 
 
-def save_data_jsonp(data, js_fname, fn_name):
+def save_data_jsonp(data, js_fname, fn_name, is_stream=False):
   f = open(js_fname, 'w')
   f.write(fn_name + '(\n')
-  f.write(json.dumps(data, indent=None))
+  if is_stream:
+    write_data_json(data, f)
+  else:
+    f.write(json.dumps(data, indent=None))
   f.write('\n);\n')
   f.close()
 
 
+def save_protein_shards(data, out_dir, fn_name='load_protein'):
+  """
+  Writes every protein of data into its own jsonp file in
+  out_dir/proteins, which calls fn_name(seqid, protein) when loaded.
+
+  Returns a copy of data where each protein is reduced to a summary
+  without matches, and 'shard' holds the path to its jsonp file.
+  """
+  shard_dir = os.path.join(out_dir, 'proteins')
+  if not os.path.isdir(shard_dir):
+    os.makedirs(shard_dir)
+  for fname in glob.glob(os.path.join(shard_dir, '*.jsonp')):
+    os.remove(fname)
+  index_data = data.copy()
+  index_data['proteins'] = {}
+  for i_seqid, seqid in enumerate(data['proteins']):
+    protein = data['proteins'][seqid]
+    shard = 'proteins/protein%d.jsonp' % i_seqid
+    f = open(os.path.join(out_dir, shard), 'w')
+    f.write(fn_name + '(\n')
+    f.write(json.dumps(seqid) + ', ')
+    f.write(json.dumps(protein, indent=None))
+    f.write('\n);\n')
+    f.close()
+    if isinstance(protein['sources'], dict):
+      sources = {}
+    else:
+      sources = [{'matches': []} for source in protein['sources']]
+    summary = {
+      'shard': shard,
+      'sources': sources,
+    }
+    for key in ['attr', 'description', 'sequence']:
+      if key in protein:
+        summary[key] = protein[key]
+    index_data['proteins'][seqid] = summary
+  return index_data
+
+
+def pack_spectrum(spectrum):
+  """
+  Returns a base64 string of the (mz, intensity) pairs of spectrum
+  packed as little-endian float32, and the list of peak labels, or
+  None if no peak is labeled.
+  """
+  values = []
+  labels = []
+  for peak in spectrum:
+    values.append(peak[0])
+    values.append(peak[1])
+    if len(peak) > 2:
+      labels.append(peak[2])
+    else:
+      labels.append('')
+  packed = base64.b64encode(struct.pack('<%df' % len(values), *values))
+  if not any(labels):
+    labels = None
+  return packed, labels
+
+
+def unpack_spectrum(packed, labels=None):
+  "Inverse of pack_spectrum, returns a list of peaks"
+  s = base64.b64decode(packed)
+  values = struct.unpack('<%df' % (len(s)//4), s)
+  spectrum = []
+  for i_peak in range(len(values)//2):
+    peak = [values[2*i_peak], values[2*i_peak+1]]
+    if labels and labels[i_peak]:
+      peak.append(labels[i_peak])
+    spectrum.append(peak)
+  return spectrum
+
+
+def pack_match_spectra(proteins):
+  """
+  Replaces the spectrum of every match by a packed string made by
+  pack_spectrum, with labels moved to match['spectrum_labels'].
+  Spectra shared between matches are only packed once.
+  """
+  packed_by_id = {}
+  for seqid, match in match_iterator(proteins):
+    if 'spectrum' not in match:
+      continue
+    spectrum = match['spectrum']
+    if isinstance(spectrum, basestring):
+      continue
+    if id(spectrum) not in packed_by_id:
+      packed_by_id[id(spectrum)] = (spectrum, pack_spectrum(spectrum))
+    packed, labels = packed_by_id[id(spectrum)][1]
+    match['spectrum'] = packed
+    if labels:
+      match['spectrum_labels'] = labels
+
+
+def pack_scan_spectra(scans):
+  "Packs the spectra of a data['scans'] table as in pack_match_spectra"
+  for scan in scans.values():
+    spectrum = scan.get('spectrum')
+    if spectrum is None or isinstance(spectrum, basestring):
+      continue
+    packed, labels = pack_spectrum(spectrum)
+    scan['spectrum'] = packed
+    if labels:
+      scan['spectrum_labels'] = labels
+
+
+def unpack_match_spectra(proteins):
+  for seqid, match in match_iterator(proteins):
+    if isinstance(match.get('spectrum'), basestring):
+      labels = match.pop('spectrum_labels', None)
+      match['spectrum'] = unpack_spectrum(match['spectrum'], labels)
+
+
+# quantization factors of float match fields in the columnar format
+columnar_scales = {
+  'intensity': 1000,
+  'mask': 1000,
+  'attr.mass': 10000,
+  'attr.mass_diff': 10000,
+  'attr.m/z': 10000,
+}
+
+
+def is_number(value):
+  return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+
+def columnize_source(source, strings, i_by_string):
+  """
+  Converts source['matches'] into parallel arrays of match fields in
+  source['columns']. Fields of match['attr'] are stored under
+  'attr.<key>', and a match without the field gets a null.
+
+  Columns of strings are stored as indices into the shared strings
+  list, and numerical columns in columnar_scales as rounded integers.
+  """
+  matches = source['matches']
+  keys = []
+  values_by_key = {}
+  def set_value(key, i_match, value):
+    if key not in values_by_key:
+      keys.append(key)
+      values_by_key[key] = [None]*len(matches)
+    values_by_key[key][i_match] = value
+  for i_match, match in enumerate(matches):
+    for key, value in match.items():
+      if key == 'attr':
+        for attr_key, attr_value in value.items():
+          set_value('attr.' + attr_key, i_match, attr_value)
+      else:
+        set_value(key, i_match, value)
+
+  columns = {}
+  string_columns = []
+  scaled_columns = {}
+  for key in keys:
+    values = values_by_key[key]
+    present = [v for v in values if v is not None]
+    if all(isinstance(v, basestring) for v in present):
+      for i, value in enumerate(values):
+        if value is None:
+          continue
+        if value not in i_by_string:
+          i_by_string[value] = len(strings)
+          strings.append(value)
+        values[i] = i_by_string[value]
+      string_columns.append(key)
+    elif key in columnar_scales and all(is_number(v) for v in present):
+      scale = columnar_scales[key]
+      for i, value in enumerate(values):
+        if value is not None:
+          values[i] = int(round(value*scale))
+      scaled_columns[key] = scale
+    columns[key] = values
+
+  del source['matches']
+  source['n_match'] = len(matches)
+  source['columns'] = columns
+  source['string_columns'] = string_columns
+  source['scaled_columns'] = scaled_columns
+
+
+def decolumnize_source(source, strings):
+  "Restores source['matches'] from a source made by columnize_source"
+  matches = [{'attr': {}} for i in range(source['n_match'])]
+  for key, values in source['columns'].items():
+    is_string = key in source['string_columns']
+    scale = source['scaled_columns'].get(key)
+    if key.startswith('attr.'):
+      targets = [match['attr'] for match in matches]
+      key = key[5:]
+    else:
+      targets = matches
+    for target, value in zip(targets, values):
+      if value is None:
+        continue
+      if is_string:
+        value = strings[value]
+      elif scale is not None:
+        value = value/float(scale)
+      target[key] = value
+  for key in ['n_match', 'columns', 'string_columns', 'scaled_columns']:
+    del source[key]
+  source['matches'] = matches
+
+
+def columnize_data(data):
+  """
+  Converts the matches of all proteins in data to the columnar
+  format, with interned strings in data['strings'].
+  """
+  strings = []
+  i_by_string = {}
+  for protein in data['proteins'].values():
+    for source in iter_sources(protein):
+      columnize_source(source, strings, i_by_string)
+  data['strings'] = strings
+
+
+def decolumnize_data(data):
+  if 'strings' not in data:
+    return
+  for protein in data['proteins'].values():
+    for source in iter_sources(protein):
+      if 'columns' in source:
+        decolumnize_source(source, data['strings'])
+  del data['strings']
+
+
 def transfer_files(in_dir, out_dir):
   if not os.path.isdir(out_dir):
     os.makedirs(out_dir)
@@ -413,7 +946,30 @@ def filter_proteins(proteins, params):
       delete_matches(proteins, is_modified_peptide)
 
 
-def make_graphical_comparison_visualisation(data, out_dir=None):
+def make_graphical_comparison_visualisation(
+    data, out_dir=None, share_seqids=True, is_stream=True,
+    shard_proteins=False, is_columnar=True, pack_spectra=False):
+  """
+  Writes the peptagram webpage for data into out_dir.
+
+  data holds 'title', 'proteins', 'source_labels', 'color_names',
+  'mask_labels', optional 'scans' and, if out_dir is None, 'out_dir'.
+
+  Options of the written data.jsonp, all read back by the viewer and
+  by do_reorder_peptagram:
+    - share_seqids: intern the other_seqids of shared peptides into
+      data['peptide_seqids'] instead of copying them into every match.
+    - is_stream: serialize data.jsonp one protein at a time; the
+      output is identical to a single json.dumps.
+    - shard_proteins: write each protein to its own jsonp file under
+      out_dir/proteins, which the viewer loads on demand. Off by
+      default as it writes one file per protein.
+    - is_columnar: store the matches of each source as columns of
+      values rather than a list of dicts with repeated keys. The
+      fields in columnar_scales are rounded to their display precision.
+    - pack_spectra: encode spectra as base64 float32 arrays. Off by
+      default as it rounds mz and intensity to single precision.
+  """
   # sanity checks
   proteins = data['proteins']
   determine_unique_matches(proteins)
@@ -421,16 +977,23 @@ def make_graphical_comparison_visualisation(data, out_dir=None):
   check_missing_fields(proteins)
   count_matches(proteins)
   do_matches(proteins, mod_str)
+  delete_unused_scans(data)
 
-  find_peptide_positions_in_proteins(proteins)
+  if share_seqids:
+    data['peptide_seqids'] = []
+    find_peptide_positions_in_proteins(proteins, data['peptide_seqids'])
+  else:
+    find_peptide_positions_in_proteins(proteins)
   for seqid, protein in proteins.items():
-    for source in protein['sources']:
+    for source in iter_sources(protein):
       matches = source['matches']
       matches.sort(key=lambda match: len(match['sequence']))
       matches.sort(key=lambda match: match['i'])
 
   if 'source_labels' not in data:
     data['source_labels'] = []
+  # sparse sources are densified by the viewer
+  data['n_source'] = max(len(data['source_labels']), get_n_source(proteins))
   if 'color_names' not in data:
     data['color_names'] = ['', '', '']
 
@@ -441,27 +1004,44 @@ def make_graphical_comparison_visualisation(data, out_dir=None):
   if not os.path.isdir(out_dir):
     os.makedirs(out_dir)
 
-  save_data_jsonp(data, os.path.join(out_dir, 'data.jsonp'), 'load_data')
+  if pack_spectra:
+    pack_match_spectra(data['proteins'])
+    if 'scans' in data:
+      pack_scan_spectra(data['scans'])
+  if is_columnar:
+    columnize_data(data)
+  if shard_proteins:
+    data = save_protein_shards(data, out_dir)
+  save_data_jsonp(
+      data, os.path.join(out_dir, 'data.jsonp'), 'load_data', is_stream)
   transfer_files(os.path.join(this_dir, 'templates/comparison'), out_dir)
   transfer_files(os.path.join(this_dir, 'templates/js'), os.path.join(out_dir, 'js'))
   index_html = os.path.abspath(os.path.join(out_dir, 'index.html'))
   logger.info('Made peptograph in "' + index_html + '"')
 
 
-def make_sequence_overview_visualisation(data, out_dir=None):
+def make_sequence_overview_visualisation(
+    data, out_dir=None, share_seqids=False, is_stream=False):
   # sanity checks
   proteins = data['proteins']
   determine_unique_matches(proteins)
   delete_empty_proteins(proteins)
   check_missing_fields(proteins)
-  find_peptide_positions_in_proteins(proteins)
+  if share_seqids:
+    data['peptide_seqids'] = []
+    find_peptide_positions_in_proteins(proteins, data['peptide_seqids'])
+  else:
+    find_peptide_positions_in_proteins(proteins)
   for seqid, protein in proteins.items():
-    for source in protein['sources']:
+    for source in iter_sources(protein):
       matches = source['matches']
       matches.sort(key=lambda match: len(match['sequence']))
       matches.sort(key=lambda match: match['i'])
   if 'source_labels' not in data:
     data['source_labels'] = []
+  # the overview page reads sources as lists
+  data['n_source'] = max(len(data['source_labels']), get_n_source(proteins))
+  densify_sources(proteins, data['n_source'])
   if 'color_names' not in data:
     data['color_names'] = ['', '', '']
 
@@ -472,7 +1052,7 @@ def make_sequence_overview_visualisation(data, out_dir=None):
   if not os.path.isdir(out_dir):
     os.makedirs(out_dir)
 
-  save_data_js(data, os.path.join(out_dir, 'data.js'))
+  save_data_js(data, os.path.join(out_dir, 'data.js'), is_stream)
   transfer_files(os.path.join(this_dir, 'templates/overview'), out_dir)
   transfer_files(os.path.join(this_dir, 'templates/js'), os.path.join(out_dir, 'js'))
   index_html = os.path.abspath(os.path.join(out_dir, 'index.html'))
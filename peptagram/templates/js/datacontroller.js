@@ -31,31 +31,135 @@ function DataController(data) {
         this.data.selected_seqid = seqid;
       }
       var protein = this.data.proteins[seqid];
+      protein.seqid = seqid;
       protein.length = protein.sequence.length;
       protein.i_res_view = 0;
       protein.i_match_selected = 0;
       protein.i_source_selected = 0;
-      for (var i=0; i<protein.sources.length; i++) {
-        var matches = protein.sources[i].matches;
-        for (var j=0; j<matches.length; j++) {
-          var match = matches[j];
-          if (('modifications' in match) && (match.modifications.length == 0)) {
-            delete match.modifications;
-          }
-          if (!('j' in match)) {
-            match.j = match.i + match.sequence.length;
-          }
+      this.densify_sources(protein);
+      this.check_matches(protein);
+      this.select_first_source(protein);
+    }
+  }
+
+  // sparse sources are written as an object keyed by the index
+  // of the sources that have matches
+  this.densify_sources = function(protein) {
+    var sources = protein.sources;
+    if (sources instanceof Array) {
+      return;
+    }
+    var n_source = this.data.n_source;
+    var dense_sources = [];
+    for (var i=0; i<n_source; i++) {
+      if (i in sources) {
+        dense_sources.push(sources[i]);
+      } else {
+        dense_sources.push({matches: []});
+      }
+    }
+    protein.sources = dense_sources;
+  }
+
+  // sources in the columnar format hold parallel arrays of match
+  // fields, with strings interned in data.strings
+  this.decode_columnar_source = function(source) {
+    var matches = [];
+    for (var i=0; i<source.n_match; i++) {
+      matches.push({attr: {}});
+    }
+    for (var key in source.columns) {
+      var values = source.columns[key];
+      var is_string = source.string_columns.indexOf(key) >= 0;
+      var scale = null;
+      if (key in source.scaled_columns) {
+        scale = source.scaled_columns[key];
+      }
+      var is_attr = key.substr(0, 5) == 'attr.';
+      var name = is_attr ? key.substr(5) : key;
+      for (var i=0; i<values.length; i++) {
+        var value = values[i];
+        if (value === null) {
+          continue;
+        }
+        if (is_string) {
+          value = this.data.strings[value];
+        } else if (scale !== null) {
+          value = value/scale;
+        }
+        if (is_attr) {
+          matches[i].attr[name] = value;
+        } else {
+          matches[i][name] = value;
         }
       }
-      for (var i=0; i<protein.sources.length; i++) {
-        var matches = protein.sources[i].matches;
-        if (matches.length > 0) {
-          protein.i_source_selected = i;
-          protein.i_res_view = matches[0]['i'];
-          break;
-        }     
+    }
+    source.matches = matches;
+    delete source.columns;
+    delete source.string_columns;
+    delete source.scaled_columns;
+  }
+
+  this.check_matches = function(protein) {
+    for (var i=0; i<protein.sources.length; i++) {
+      if ('columns' in protein.sources[i]) {
+        this.decode_columnar_source(protein.sources[i]);
       }
     }
+    for (var i=0; i<protein.sources.length; i++) {
+      var matches = protein.sources[i].matches;
+      for (var j=0; j<matches.length; j++) {
+        var match = matches[j];
+        if (('modifications' in match) && (match.modifications.length == 0)) {
+          delete match.modifications;
+        }
+        if (!('j' in match)) {
+          match.j = match.i + match.sequence.length;
+        }
+      }
+    }
+  }
+
+  this.select_first_source = function(protein) {
+    for (var i=0; i<protein.sources.length; i++) {
+      var matches = protein.sources[i].matches;
+      if (matches.length > 0) {
+        protein.i_source_selected = i;
+        protein.i_res_view = matches[0]['i'];
+        break;
+      }     
+    }
+  }
+
+  // proteins saved as shards only hold a summary, and their 
+  // matches are fetched from their own jsonp file when picked
+  this.load_protein = function(seqid) {
+    var protein = this.data.proteins[seqid];
+    if (!exists(protein) || !('shard' in protein) || protein.is_loading) {
+      return;
+    }
+    protein.is_loading = true;
+    var _this = this;
+    window.load_protein = function(shard_seqid, shard_protein) {
+      _this.receive_protein(shard_seqid, shard_protein);
+    }
+    load_script(protein.shard);
+  }
+
+  this.receive_protein = function(seqid, shard_protein) {
+    var protein = this.data.proteins[seqid];
+    protein.sources = shard_protein.sources;
+    delete protein.shard;
+    delete protein.is_loading;
+    this.densify_sources(protein);
+    this.check_matches(protein);
+    var i_source = protein.i_source_selected;
+    if (protein.sources[i_source].matches.length == 0) {
+      this.select_first_source(protein);
+    }
+    if (seqid == this.data.selected_seqid && exists(this.data.observer)) {
+      this.data.observer();
+    }
   }
 
   this.check_location_hash = function() {
@@ -110,7 +214,45 @@ function DataController(data) {
     if ((i_match < 0) || (matches.length == 0)) {
       return null;
     }
-    return matches[i_match];
+    var match = matches[i_match];
+    this.resolve_other_seqids(protein, match);
+    this.resolve_scan(match);
+    return match;
+  }
+
+  // matches of the same scan refer to a single entry in data.scans
+  // that holds the spectrum and scan attributes
+  this.resolve_scan = function(match) {
+    if (!('scan' in match) || !('scans' in this.data)) {
+      return;
+    }
+    var scan = this.data.scans[match.scan];
+    if ('spectrum' in scan) {
+      decode_spectrum(scan);
+      match.spectrum = scan.spectrum;
+    }
+    for (var key in scan.attr) {
+      if (!(key in match.attr)) {
+        match.attr[key] = scan.attr[key];
+      }
+    }
+    delete match.scan;
+  }
+
+  // matches that share a peptide refer to a single entry in
+  // data.peptide_seqids, which is only expanded when displayed
+  this.resolve_other_seqids = function(protein, match) {
+    if (!('i_peptide_seqids' in match) || ('other_seqids' in match.attr)) {
+      return;
+    }
+    var seqids = this.data.peptide_seqids[match.i_peptide_seqids];
+    var other_seqids = [];
+    for (var i=0; i<seqids.length; i++) {
+      if (seqids[i] != protein.seqid) {
+        other_seqids.push(seqids[i]);
+      }
+    }
+    match.attr.other_seqids = other_seqids;
   }
 
   this.set_location_hash = function() {
@@ -145,6 +287,7 @@ function DataController(data) {
 
   this.pick_protein = function(seqid) {
     this.data.selected_seqid = seqid;
+    this.load_protein(seqid);
     this.set_location_hash();
   }
 
@@ -224,6 +367,7 @@ function DataController(data) {
   this.get_labeled_spectrum = function() {
     var match = this.get_selected_match();
     if (!('labeled_peaks' in match)) {
+      decode_spectrum(match);
       match.labeled_peaks = match.spectrum.slice(0);
       for (ion_type in this.data.ion_types) {
         if (this.data.ion_types[ion_type]) {
@@ -335,5 +479,6 @@ function DataController(data) {
   this.init();
   this.check_data();
   this.check_location_hash();
+  this.load_protein(this.data.selected_seqid);
 }
 
@@ -50,6 +50,10 @@ function ProteinBarWidget(canvas, data, seqid) {
 
 
 function count_matches(protein) {
+  if ('shard' in protein) {
+    // keep the counts of the summary until the matches are loaded
+    return;
+  }
   protein.attr.n_match = 0;
   protein.attr.n_match_unique = 0;
   protein.attr.n_slice_populated = 0;
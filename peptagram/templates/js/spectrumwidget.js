@@ -1,3 +1,30 @@
+// Spectra can be packed by the python peptagram.proteins.pack_spectrum
+// into a base64 string of little-endian float32 (mz, intensity) pairs,
+// with peak labels in match.spectrum_labels
+function decode_spectrum(match) {
+  if (typeof match.spectrum != 'string') {
+    return;
+  }
+  var bytes = atob(match.spectrum);
+  var buffer = new ArrayBuffer(bytes.length);
+  var byte_array = new Uint8Array(buffer);
+  for (var i=0; i<bytes.length; i++) {
+    byte_array[i] = bytes.charCodeAt(i);
+  }
+  var view = new DataView(buffer);
+  var n_peak = bytes.length/8;
+  var spectrum = [];
+  for (var i=0; i<n_peak; i++) {
+    var peak = [view.getFloat32(8*i, true), view.getFloat32(8*i + 4, true)];
+    if (('spectrum_labels' in match) && match.spectrum_labels[i]) {
+      peak.push(match.spectrum_labels[i]);
+    }
+    spectrum.push(peak);
+  }
+  match.spectrum = spectrum;
+}
+
+
 function SpectrumWidget(canvas, data) {
   this.canvas = canvas;
   this.data = data;
@@ -5,7 +5,11 @@ from pprint import pprint
 
 import re
 import math
-import xml.etree.ElementTree as etree
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
 
 import logging
 
@@ -34,74 +38,116 @@ Main API entry:
 
 
 def strip_whitespace(txt):
-  result = ""
-  for line in txt.splitlines():
-    result += ''.join(line.split())
-  return result
+  return ''.join(txt.split())
+
+
+def parse_gaml_values(txt, n_value=None):
+  """
+  Returns the floats of a whitespace-separated GAML values string, as
+  a numpy array converted in a single call if numpy is available,
+  otherwise as a list. Falls back to the list if the numpy
+  conversion doesn't give n_value floats.
+  """
+  if np is not None:
+    values = np.fromstring(txt, sep=' ')
+    if n_value is None or len(values) == n_value:
+      return values
+  return map(float, txt.split())
+
+
+def get_peaks(scan):
+  """
+  Returns the (mz, intensity) peaks of a scan read by read_xtandem, as
+  an (n, 2) numpy array if numpy is available, otherwise as a list of
+  pairs. Either goes through proteins.get_top_peaks before output.
+  """
+  n_value = scan['n_value']
+  masses = parse_gaml_values(scan['masses'], n_value)
+  intensities = parse_gaml_values(scan['intensities'], n_value)
+  if hasattr(masses, 'argsort') and hasattr(intensities, 'argsort'):
+    return np.column_stack((masses, intensities))
+  return zip(masses, intensities)
+
+
+def parse_trace(trace_elem, scan):
+  """
+  Reads the charge, mass and raw GAML peak values of a spectrum trace
+  in one pass over its children, without namespaced finds.
+  """
+  for elem in trace_elem:
+    tag = parse.get_local_tag(elem.tag)
+    if tag == 'attribute':
+      attr_type = elem.get('type')
+      if attr_type == 'charge':
+        scan['charge'] = elem.text.strip()
+      elif attr_type == 'M+H':
+        scan['mass'] = elem.text.strip()
+    elif tag == 'Xdata' or tag == 'Ydata':
+      for values_elem in elem:
+        if parse.get_local_tag(values_elem.tag) == 'values':
+          if tag == 'Xdata':
+            scan['masses'] = values_elem.text
+            n_value = values_elem.get('numvalues')
+            if n_value is not None:
+              scan['n_value'] = int(n_value)
+          else:
+            scan['intensities'] = values_elem.text
 
 
-def parse_scan(top_elem, nsmap):
+def parse_scan(top_elem):
   scan = {}
   scan.update(parse.parse_attrib(top_elem))
 
   scan['matches'] = []
-  for protein in top_elem.findall('protein'):
-    words = protein.attrib['label'].split()
-    seqid = words[0]
-    description = ' '.join(words[1:])
-    peptide_elem = protein.find('peptide')
-    sequence = strip_whitespace(peptide_elem.text)
-    match = {  
-      'seqid': seqid,
-      'sequence': sequence,
-      'description': description,
-      'modifications': []
-    }
-    domain_elem = peptide_elem.find('domain')
-    for mod_elem in domain_elem.findall('aa'):
-      match['modifications'].append(parse.parse_attrib(mod_elem))
-    match.update(parse.parse_attrib(domain_elem))
-    scan['matches'].append(match)
-
-  elem = top_elem.find('group[@label="fragment ion mass spectrum"]')
-
-  note = elem.find('note')
-  if note is not None:
-    scan['Description'] = elem.find('note').text.strip()
-  else:
-    scan['Description'] = ''
-
-  masses_elem = elem.find(
-      'GAML:trace/GAML:Xdata/GAML:values', namespaces=nsmap)
-  scan['masses'] = masses_elem.text.strip()
-
-  intensities_elem = elem.find(
-      'GAML:trace/GAML:Ydata/GAML:values', namespaces=nsmap)
-  scan['intensities'] = intensities_elem.text.strip()
-
-  charge_elem = elem.find(
-      'GAML:trace/GAML:attribute[@type="charge"]', namespaces=nsmap)
-  scan['charge'] = charge_elem.text.strip()
-
-  mass_elem = elem.find(
-      'GAML:trace/GAML:attribute[@type="M+H"]', namespaces=nsmap)
-  scan['mass'] = mass_elem.text.strip()
+  scan['Description'] = ''
+  scan['n_value'] = None
+  for elem in top_elem:
+    if elem.tag == 'protein':
+      words = elem.attrib['label'].split()
+      seqid = words[0]
+      description = ' '.join(words[1:])
+      peptide_elem = elem.find('peptide')
+      sequence = strip_whitespace(peptide_elem.text)
+      match = {  
+        'seqid': seqid,
+        'sequence': sequence,
+        'description': description,
+        'modifications': []
+      }
+      domain_elem = peptide_elem.find('domain')
+      for mod_elem in domain_elem.findall('aa'):
+        match['modifications'].append(parse.parse_attrib(mod_elem))
+      match.update(parse.parse_attrib(domain_elem))
+      scan['matches'].append(match)
+    elif elem.tag == 'group' and \
+        elem.get('label') == 'fragment ion mass spectrum':
+      for child in elem:
+        tag = parse.get_local_tag(child.tag)
+        if tag == 'note':
+          scan['Description'] = child.text.strip()
+        elif tag == 'trace':
+          parse_trace(child, scan)
 
   return scan
 
 
 def read_xtandem(xtandem_xml):
-  fastas = {}
-  scans = []
-  nsmap = {}
-  for event, elem in etree.iterparse(xtandem_xml, events=('end', 'start-ns')):
-    if event == 'start-ns':
-      nsmap.update({elem})
-    if event == 'end':
-      if elem.tag == 'group' and elem.attrib['type'] == 'model':
-        scan = parse_scan(elem, nsmap)
-        yield scan
-        elem.clear()
+  """
+  Yields the scans of the model groups in an X!Tandem output file.
+  Only group elements are parsed into events, and each model group
+  is dropped from the tree once read, so that large files are 
+  streamed in bounded memory.
+  """
+  root = None
+  for event, elem in parse.iterparse(
+      xtandem_xml, events=('start', 'end'), tags=['bioml', 'group']):
+    if event == 'start':
+      if root is None:
+        root = elem
+      continue
+    if elem.tag == 'group' and elem.get('type') == 'model':
+      yield parse_scan(elem)
+      parse.clear_element(elem, root)
 
 
 def get_proteins(
@@ -114,10 +160,7 @@ def get_proteins(
   print_scan = True
   for scan in read_xtandem(xtandem_fname):
     scan_id = scan['id']
-    x_vals = map(float, scan['masses'].split())
-    y_vals = map(float, scan['intensities'].split())
-    ions = [(x, y) for x, y in zip(x_vals, y_vals)]
-    ions.sort(key=lambda i:-i[1])
+    ions = None
 
     for xtandem_match in scan['matches']:
 
@@ -125,6 +168,9 @@ def get_proteins(
       if cutoff_expect < expect:
         continue
 
+      if ions is None:
+        ions = proteins_module.get_top_peaks(get_peaks(scan), n_peak)
+
       intensity = proteins_module.calc_minus_log_intensity(
         expect, good_expect, cutoff_expect)
 
@@ -145,7 +191,7 @@ def get_proteins(
         'sequence': xtandem_match['seq'],
         'intensity': intensity,
         'modifications': [],
-        'spectrum': ions[:n_peak],
+        'spectrum': ions,
         'attr': {
           'scan_id': scan['id'],
           'charge': scan['charge'],
@@ -38,6 +38,8 @@ import sys
 import re
 import os
 import bisect
+import json
+import struct
 
 from xml.etree import cElementTree
 
@@ -80,6 +82,19 @@ class Reader(object):
     :type MS1_Precision: float
     :param MSn_Precision: measured precision of MSn spectra
     :type MSn_Precision: float
+    :param offsetCache: store the spectrum offset index next to the file in
+        path + '.offsets', keyed by file size and mtime, so that later opens
+        skip the index scan. Fails silently if the directory is read-only.
+        Off by default, as it writes next to the input file.
+    :type offsetCache: boolean
+    :param indexGzip: record the uncompressed offsets of a gzipped file in
+        one pass, giving random access at the cost of decompressing up to
+        the requested spectrum. Best used with ascending access.
+    :type indexGzip: boolean
+    :param useNumpy: decode spectra into numpy arrays, so that mz, i and
+        peaks are arrays and peaks an (n, 2) array of m/z and intensity.
+        Ignored if numpy is not installed.
+    :type useNumpy: boolean
 
     Example:
 
@@ -93,7 +108,10 @@ class Reader(object):
                      noiseThreshold = 0.0,
                      extraAccessions = None,
                      MS1_Precision = 5e-6,
-                     MSn_Precision = 20e-6
+                     MSn_Precision = 20e-6,
+                     offsetCache = False,
+                     indexGzip = False,
+                     useNumpy = False
         ):
 
 
@@ -103,6 +121,7 @@ class Reader(object):
         self.param['noiseThreshold'] = noiseThreshold
         self.param['MS1_Precision'] = MS1_Precision
         self.param['MSn_Precision'] = MSn_Precision
+        self.param['useNumpy'] = useNumpy
         self.param['accessions'] = { }
 
         # self.info contains information extracted from the mzML file
@@ -126,6 +145,17 @@ class Reader(object):
             import gzip, codecs
             self.info['fileObject'] = codecs.getreader("utf-8")(gzip.open(self.info['filename']))
             self.info['seekable'] = False
+            if indexGzip:
+                if not (offsetCache and self._readOffsetCache()):
+                    self._indexGzip()
+                    if offsetCache:
+                        self._writeOffsetCache()
+                self.seeker = gzip.open(self.info['filename'],'rb')
+                self.info['seekable'] = True
+        elif offsetCache and self._readOffsetCache():
+            self.info['fileObject'] = open(self.info['filename'],'r')
+            self.info['seekable'] = True
+            self.seeker = open(self.info['filename'],'r')
         else:
             self.info['fileObject'] = open(self.info['filename'],'r')
             self.info['seekable'] = True
@@ -190,6 +220,8 @@ class Reader(object):
                 # opening seeker in normal mode again
                 self.seeker.close()
                 self.seeker = open(self.info['filename'],'r')
+                if offsetCache:
+                    self._writeOffsetCache()
 
         ### declare the iter
         self.iter = iter(cElementTree.iterparse(self.info['fileObject'], events = ( b'start',b'end'))) # NOTE: end might be sufficient
@@ -236,6 +268,109 @@ class Reader(object):
 
         return
 
+    def _fileStamp(self):
+        stat = os.stat(self.info['filename'])
+        return stat.st_size, stat.st_mtime
+
+    def _readOffsetCache(self):
+        """
+        Loads the offset index stored by :py:meth:`_writeOffsetCache`
+        if it matches the size and mtime of the mzML file.
+        Returns True on success.
+        """
+        cachePath = self.info['filename'] + '.offsets'
+        try:
+            with open(cachePath, 'rb') as f:
+                header = json.loads(bytes.decode(f.readline()))
+                size, mtime = self._fileStamp()
+                if header.get('version') != 1 or header['size'] != size or header['mtime'] != mtime:
+                    return False
+                n = header['count']
+                ids = struct.unpack('<%dq' % n, f.read(8*n))
+                offsetList = list(struct.unpack('<%dq' % n, f.read(8*n)))
+        except (IOError, OSError, ValueError, KeyError, struct.error):
+            return False
+        names = header['names']
+        for i, (nativeID, offset) in enumerate(zip(ids, offsetList)):
+            key = names.get(str(i), nativeID)
+            self.info['offsets'][key] = offset
+        self.info['offsetList'] = offsetList
+        self.info['offsets']['indexList'] = header['indexList']
+        self.info['offsets']['TIC'] = header['TIC']
+        self.info['encoding'] = header['encoding']
+        if header['dataSize'] is not None:
+            self.info['dataSize'] = header['dataSize']
+        return True
+
+    def _writeOffsetCache(self):
+        """
+        Stores the offset index as a one line json header followed by
+        two little-endian int64 arrays: native IDs and offsets in file
+        order. Non-numeric IDs are kept in the header.
+        """
+        offsets = self.info['offsets']
+        offsetList = self.info['offsetList']
+        keyByOffset = {}
+        for key, offset in offsets.items():
+            if key != 'indexList':
+                keyByOffset[offset] = key
+        ids = []
+        names = {}
+        for i, offset in enumerate(offsetList):
+            key = keyByOffset.get(offset)
+            if isinstance(key, int):
+                ids.append(key)
+            else:
+                ids.append(-1)
+                names[str(i)] = key
+        size, mtime = self._fileStamp()
+        header = {
+            'version': 1,
+            'size': size,
+            'mtime': mtime,
+            'count': len(offsetList),
+            'names': names,
+            'indexList': offsets.get('indexList'),
+            'TIC': offsets.get('TIC'),
+            'encoding': self.info.get('encoding'),
+            'dataSize': self.info.get('dataSize'),
+        }
+        try:
+            with open(self.info['filename'] + '.offsets', 'wb') as f:
+                f.write(json.dumps(header).encode('utf-8') + b'\n')
+                f.write(struct.pack('<%dq' % len(ids), *ids))
+                f.write(struct.pack('<%dq' % len(offsetList), *offsetList))
+        except (IOError, OSError):
+            pass
+
+    def _indexGzip(self):
+        """
+        Records the uncompressed offsets of all spectra and
+        chromatograms in a gzipped mzML file, in a single pass.
+        """
+        import gzip
+        tagPattern = re.compile( b'<(?P<tag>spectrum|chromatogram)\\s[^>]*?\\bid="(?P<id>[^"]*)"' )
+        self.info['encoding'] = None
+        self.info['offsets']['indexList'] = None
+        self.info['offsets']['TIC'] = None
+        pos = 0
+        with gzip.open(self.info['filename'], 'rb') as f:
+            for line in f:
+                for match in tagPattern.finditer(line):
+                    nativeID = bytes.decode(match.group('id'))
+                    if match.group('tag') == b'spectrum':
+                        try:
+                            nativeID = int(re.search( r'[0-9]*$', nativeID ).group())
+                        except ValueError:
+                            continue
+                    offset = pos + match.start()
+                    self.info['offsets'][nativeID] = offset
+                    self.info['offsetList'].append(offset)
+                    if nativeID == 'TIC':
+                        self.info['offsets']['TIC'] = offset
+                pos += len(line)
+        self.info['dataSize'] = pos
+
     def __iter__(self):
         return self
 
@@ -274,7 +409,8 @@ class Reader(object):
     def __getitem__(self,value):
         '''
         Random access to spectra if mzML fill is indexed,
-        not compressed and not truncted.
+        not compressed and not truncted, or if a gzipped file
+        was opened with indexGzip.
 
         Example:
 
@@ -290,7 +426,9 @@ class Reader(object):
                 startPos = self.info['offsets'][value]
                 endPos_index = bisect.bisect_right(self.info['offsetList'],self.info['offsets'][value])
                 if endPos_index == len(self.info['offsetList']):
-                    endPos = os.path.getsize(self.info['filename'])
+                    endPos = self.info.get('dataSize', None)
+                    if endPos is None:
+                        endPos = os.path.getsize(self.info['filename'])
                 else:
                     endPos = self.info['offsetList'][endPos_index]
 
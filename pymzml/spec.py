@@ -48,6 +48,11 @@ from collections import defaultdict as ddict
 from operator import itemgetter as itemgetter
 import zlib
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 PROTON = 1.00727646677
 ISOTOPE_AVERAGE_DIFFERENCE = 1.002
 
@@ -92,7 +97,7 @@ class Spectrum(dict):
         """
         assert isinstance(otherSpec,Spectrum) , "can only add two pymzML spectra together ..."
         tmp = self.deRef()
-        if tmp._reprofiledPeaks == None:
+        if tmp._reprofiledPeaks is None:
             tmp._reprofiledPeaks = tmp._reprofile_Peaks()
 
         for mz,i in otherSpec.reprofiledPeaks:
@@ -118,7 +123,7 @@ class Spectrum(dict):
         assert isinstance(otherSpec,Spectrum) , "can only subtract two pymzML spectra ..."
         tmp = self.deRef()
         
-        if tmp._reprofiledPeaks == None:
+        if tmp._reprofiledPeaks is None:
             tmp._reprofiledPeaks = tmp._reprofile_Peaks()
 
         for mz,i in otherSpec.reprofiledPeaks:
@@ -143,11 +148,11 @@ class Spectrum(dict):
         """
         assert isinstance(value, (int, float)), "require float or int of intensity values ..."
         tmp = self.deRef()
-        if tmp._peaks != None:
+        if tmp._peaks is not None:
             tmp.peaks  = [(mz, i * float(value)) for mz, i in tmp.peaks]
-        if tmp._centroidedPeaks != None:
+        if tmp._centroidedPeaks is not None:
             tmp.centroidedPeaks = [(mz, i * float(value)) for mz, i in tmp.centroidedPeaks]
-        if tmp._reprofiledPeaks != None:
+        if tmp._reprofiledPeaks is not None:
             for mz in tmp._reprofiledPeaks.keys():
                 tmp._reprofiledPeaks[mz] *= float(value)
         return tmp
@@ -162,11 +167,11 @@ class Spectrum(dict):
         """
         assert isinstance( value , ( int , float ) ), "require float or int of intensity values ..."
         tmp = self.deRef()
-        if tmp._peaks != None:
+        if tmp._peaks is not None:
             tmp.peaks  = [ (mz,i/float(value)) for mz,i in tmp.peaks ]
-        if tmp._centroidedPeaks != None:
+        if tmp._centroidedPeaks is not None:
             tmp.centroidedPeaks = [ (mz,i/float(value)) for mz,i in tmp.centroidedPeaks ]
-        if tmp._reprofiledPeaks != None:
+        if tmp._reprofiledPeaks is not None:
             for mz in tmp._reprofiledPeaks.keys():
                 tmp._reprofiledPeaks[mz] /= float(value)
         return tmp
@@ -174,6 +179,16 @@ class Spectrum(dict):
     def __div__(self,value):
         return self.__truediv__(value)
 
+    def _useNumpy(self):
+        """
+        True if spectra should be decoded into numpy arrays, which is
+        requested by the Reader parameter useNumpy and needs numpy.
+        """
+        return np is not None and self.param is not None and self.param.get('useNumpy', False)
+
+    def _isArray(self, peaks):
+        return np is not None and isinstance(peaks, np.ndarray)
+
     def __del__(self):
         self.clear()
         del self
@@ -220,7 +235,7 @@ class Spectrum(dict):
         tables as well.
         """
         if scope == 'all':
-            if self._peaks == None:
+            if self._peaks is None:
                 # decode, just in case ...
                 self.peaks
             self._tmzSet = None
@@ -249,7 +264,7 @@ class Spectrum(dict):
         :return: Returns a list of mz from the actual analysed spectrum
 
         """
-        if self._mz == None:
+        if self._mz is None:
             self._decode()
         return self._mz
 
@@ -272,7 +287,7 @@ class Spectrum(dict):
         :return: Returns a list of mz from the actual analysed spectrum
 
         """
-        if self._mz == None:
+        if self._mz is None:
             self._decode()
         return self._mz
 
@@ -288,7 +303,7 @@ class Spectrum(dict):
         """
         if key not in ['mz','i']:
             print("Dont understand extreme request ", file = sys.stderr)
-        if self._extremeValues == None:
+        if self._extremeValues is None:
             self._extremeValues = {}
         try:
             if key == 'mz':
@@ -315,7 +330,7 @@ class Spectrum(dict):
             spectrum.
 
         """
-        if self._i == None:
+        if self._i is None:
             self._decode()
         return self._i
 
@@ -349,9 +364,11 @@ class Spectrum(dict):
         """
         if 'reprofiled' in self.keys():
             self.peaks = self._centroid_peaks()
-        elif self._peaks == None:
-            if self._mz == None and 'encodedData' not in self.keys():
+        elif self._peaks is None:
+            if self._mz is None and 'encodedData' not in self.keys():
                 self._peaks = []
+            elif self._isArray(self.mz) and self._isArray(self.i):
+                self._peaks = np.column_stack((self.mz, self.i))
             else:
                 self._peaks = list(zip(self.mz , self.i))
         return self._peaks
@@ -374,8 +391,8 @@ class Spectrum(dict):
         """
         if 'reprofiled' in self.keys():
             self.peaks = self._centroid_peaks()
-        elif self._peaks == None:
-            if self._mz == None and 'encodedData' not in self.keys():
+        elif self._peaks is None:
+            if self._mz is None and 'encodedData' not in self.keys():
                 self._peaks = []
             else:
                 self._peaks = list(zip(self.mz , self.i))
@@ -384,6 +401,12 @@ class Spectrum(dict):
 
     @peaks.setter
     def peaks(self,mz_i_tuple_list):
+        if self._isArray(mz_i_tuple_list):
+            # (n, 2) array of m/z and intensity columns
+            self._mz = mz_i_tuple_list[:, 0]
+            self._i = mz_i_tuple_list[:, 1]
+            self._peaks = mz_i_tuple_list
+            return self
         assert type(mz_i_tuple_list) == type([]), "require list of tuples (mz,intensity) ..."
         if len(mz_i_tuple_list) == 0:
             return
@@ -416,13 +439,13 @@ class Spectrum(dict):
             self.peaks = self._centroid_peaks()
             self._centroidedPeaks = self._peaks
 
-        if self._centroidedPeaks == None: #or self._reprofiledPeaks != None:
+        if self._centroidedPeaks is None: #or self._reprofiledPeaks is not None:
             self._centroidedPeaks = self._centroid_peaks()
         return self._centroidedPeaks
 
     @centroidedPeaks.setter
     def centroidedPeaks(self,mz_i_tuple_list):
-        assert type(mz_i_tuple_list) == type([]), "require list of tuples (mz,intensity) ..."
+        assert type(mz_i_tuple_list) == type([]) or self._isArray(mz_i_tuple_list), "require list of tuples (mz,intensity) ..."
         self._centroidedPeaks = mz_i_tuple_list
         return
 
@@ -518,7 +541,7 @@ class Spectrum(dict):
 
         :rtype: set
         """
-        if self._tmzSet == None:
+        if self._tmzSet is None:
             self._tmzSet = set()
             for mz, i in self.centroidedPeaks:
                 self._tmzSet |= set(
@@ -536,7 +559,7 @@ class Spectrum(dict):
 
         :rtype: set
         '''
-        if self._tmassSet == None:
+        if self._tmassSet is None:
             self._tmassSet = set(self._transformed_mass_with_error.keys())
         return self._tmassSet
 
@@ -568,7 +591,11 @@ class Spectrum(dict):
         #NOTE Total ion current should be adjusted as well, I guess ;)
         assert type(mzRange) == type(()), "require tuple of (min,max) mz range to reduce spectrum"
         if mzRange != (None, None):
-            tmp_peaks = [ (mz,i) for mz, i in self.peaks if mzRange[0] <= mz <= mzRange[1] ]
+            if self._isArray(self.peaks):
+                mz = self.peaks[:, 0]
+                tmp_peaks = self.peaks[(mzRange[0] <= mz) & (mz <= mzRange[1])]
+            else:
+                tmp_peaks = [ (mz,i) for mz, i in self.peaks if mzRange[0] <= mz <= mzRange[1] ]
             self.clear(scope = 'not_all')
             self.peaks = tmp_peaks
         return self
@@ -599,14 +626,20 @@ class Spectrum(dict):
         ...         print(mz, i)
 
         """
-        if noiseLevel == None:
+        if noiseLevel is None:
             noiseLevel = self.estimatedNoiseLevel(mode = mode)
 
-        if self._peaks != None:
-            self.peaks  = [ (mz,i) for mz,i in self.peaks  if i >= noiseLevel]
+        if self._peaks is not None:
+            if self._isArray(self.peaks):
+                self.peaks = self.peaks[self.peaks[:, 1] >= noiseLevel]
+            else:
+                self.peaks  = [ (mz,i) for mz,i in self.peaks  if i >= noiseLevel]
 
-        if self._centroidedPeaks != None:
-            self.centroidedPeaks = [ (mz,i) for mz,i in self.centroidedPeaks  if i >= noiseLevel]
+        if self._centroidedPeaks is not None:
+            if self._isArray(self.centroidedPeaks):
+                self.centroidedPeaks = self.centroidedPeaks[self.centroidedPeaks[:, 1] >= noiseLevel]
+            else:
+                self.centroidedPeaks = [ (mz,i) for mz,i in self.centroidedPeaks  if i >= noiseLevel]
 
         self._reprofiledPeaks = None
         return self
@@ -630,20 +663,37 @@ class Spectrum(dict):
         ...                print(mz,i)
 
         """
-        if self._centroidedPeaksSortedByI == None:
-            self._centroidedPeaksSortedByI = sorted(self.centroidedPeaks, key = itemgetter(1))
+        if self._centroidedPeaksSortedByI is None:
+            if self._isArray(self.centroidedPeaks):
+                order = np.argsort(self.centroidedPeaks[:, 1], kind = 'mergesort')
+                self._centroidedPeaksSortedByI = self.centroidedPeaks[order]
+            else:
+                self._centroidedPeaksSortedByI = sorted(self.centroidedPeaks, key = itemgetter(1))
         return self._centroidedPeaksSortedByI[-n:]
 
     def estimatedNoiseLevel(self, mode = 'median'):
         """
         Calculates noise threshold for function :py:func:`removeNoise`
         """
-        if self.centroidedPeaks == []:
+        if len(self.centroidedPeaks) == 0:
             return 0
 
         if 'noiseLevelEstimate' not in self.keys():
             self['noiseLevelEstimate'] = {}
-        if mode not in self['noiseLevelEstimate'].keys():
+        if mode not in self['noiseLevelEstimate'].keys() and self._isArray(self.centroidedPeaks):
+            intensities = self.centroidedPeaks[:, 1]
+            if mode == 'median':
+                self['noiseLevelEstimate']['median'] = self._arrayMedian(intensities)
+            elif mode == 'mad':
+                median = self.estimatedNoiseLevel(mode='median')
+                self['noiseLevelEstimate']['mad'] = self._arrayMedian(np.abs(intensities - median))
+            elif mode == 'mean':
+                mean = float(intensities.mean())
+                self['noiseLevelEstimate']['mean'] = mean
+                self['noiseLevelEstimate']['variance'] = float(((intensities - mean) ** 2).mean())
+            else:
+                print("dont understand noise level estimation method call", mode, file = sys.stderr)
+        elif mode not in self['noiseLevelEstimate'].keys():
             if mode == 'median':
                 self['noiseLevelEstimate']['median'] = self._median([ i for mz, i in self.centroidedPeaks])
             elif mode == 'mad':
@@ -657,6 +707,11 @@ class Spectrum(dict):
                 print("dont understand noise level estimation method call", mode, file = sys.stderr)
         return self['noiseLevelEstimate'][mode]
 
+    def _arrayMedian(self, data):
+        # same element as _median picks, without sorting
+        l = len(data)
+        return float(np.partition(data, l // 2)[l // 2])
+
     def _median(self, data):
         if len(data) == 0:
             return None
@@ -686,8 +741,8 @@ class Spectrum(dict):
 
         """
         #NOTE self._reprofiledPeaks is a defaultdict(int) with k:mz, v:i
-        if self._reprofiledPeaks == None:
-            if self.mz != []:
+        if self._reprofiledPeaks is None:
+            if len(self.mz) != 0:
                 self._reprofiledPeaks = self._reprofile_Peaks()
             else:
                 self._reprofiledPeaks = ddict(int)
@@ -776,9 +831,12 @@ class Spectrum(dict):
                     floattype = None
                     print("New data encoding detected, please adjust parser", file = sys.stderr)
 
-                unpackedData = []
+                if self._useNumpy():
+                    unpackedData = np.zeros(0)
+                else:
+                    unpackedData = []
 
-                if self['encodedData'][int(pos*0.5)] == None:
+                if self['encodedData'][int(pos*0.5)] is None:
                     pass
                 elif len(self['encodedData'][int(pos*0.5)]) == 0:
                     pass
@@ -793,7 +851,10 @@ class Spectrum(dict):
                         exit(1)
                     fmt = "{endian}{arraylength}{floattype}".format( endian = "<" , arraylength = self['defaultArrayLength'] , floattype = floattype )
                     try:
-                        unpackedData = unpack( fmt , decodedData)
+                        if self._useNumpy():
+                            unpackedData = np.frombuffer(decodedData, dtype = '<f4' if floattype == 'f' else '<f8', count = self['defaultArrayLength'])
+                        else:
+                            unpackedData = unpack( fmt , decodedData)
                     except: # NOTE raises struct.error, but cannot be checked for here
                         print("Couldn't extract data {0} fmt: {1}".format(arrayType, fmt), file = sys.stderr)
                         print(len(self['encodedData'][int(pos * 0.5)]), file = sys.stderr)
@@ -876,7 +937,7 @@ class Spectrum(dict):
             [(m/z,intensity), ...], ...}
 
         """
-        if self._transformedMzWithError == None:
+        if self._transformedMzWithError is None:
             self._transformedMzWithError = ddict(list)
             for mz, i in self.centroidedPeaks:
                 for t_mz_with_error in range(int(round((mz - (mz * self.measuredPrecision)) * self.internalPrecision)),
@@ -894,7 +955,7 @@ class Spectrum(dict):
             (mass,intensity), ...}
 
         """
-        if self._transformedMassWithError == None:
+        if self._transformedMassWithError is None:
             self._transformedMassWithError = ddict(list)
             for mass, i in self.deconvolutedPeaks:
                 for t_mass_with_error in range(int(round((mass - (mass * self.measuredPrecision)) * self.internalPrecision)),
@@ -912,7 +973,7 @@ class Spectrum(dict):
             values are adjusted by the internal precision to integers.
 
         """
-        if self._transformedPeaks == None:
+        if self._transformedPeaks is None:
             self._transformedPeaks = [(self.transformMZ(mz), i) for mz, i in self.centroidedPeaks]
         return self._transformedPeaks
 
@@ -926,7 +987,7 @@ class Spectrum(dict):
             values are adjusted by the internal precision to integers.
 
         """
-        if self._transformed_deconvolutedPeaks == None:
+        if self._transformed_deconvolutedPeaks is None:
             self._transformed_deconvolutedPeaks = [(self.transformMZ(mass), i) for mass, i in self.deconvolutedPeaks]
         return self._transformed_deconvolutedPeaks
 
@@ -1106,7 +1167,7 @@ class Spectrum(dict):
         :return: list of deconvoluted peaks (mass (instead of m/z) / intensity tuples)
 
         """
-        if self._deconvolutedPeaks == None:
+        if self._deconvolutedPeaks is None:
             self._deconvolutedPeaks = self.deconvolute_peaks(ppmFactor = 4, minCharge = 1, maxCharge = 8, maxNextPeaks = 100)
         return self._deconvolutedPeaks
 
@@ -1,4 +1,5 @@
 import os, glob
 for py in glob.glob('*_peptagram.py'):
     if 'reorder' not in py:
-        os.system('python {} test'.format(py))
\ No newline at end of file
+        os.system('python {} test'.format(py))
+os.system('python -m unittest discover tests')
@@ -0,0 +1,116 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from peptagram import mascot
+
+
+boundary = 'gc0p4Jq0M2Yt08jU534c0p'
+aas = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def make_mascot_dat(fname, n_query=20):
+  "Writes a small synthetic Mascot .dat file of n_query queries"
+  random.seed(7)
+  seqids = ['sp|P%05d|PROT%d_HUMAN' % (i, i) for i in range(5)]
+  lines = [
+    'MIME-Version: 1.0 (Generated by Mascot version 1.0)',
+    'Content-Type: multipart/mixed; boundary=' + boundary,
+    '',
+  ]
+  def push_section(name):
+    lines.append('--' + boundary)
+    lines.append('Content-Type: application/x-Mascot; name="%s"' % name)
+    lines.append('')
+  push_section('parameters')
+  lines.append('MODS=Oxidation (M)')
+  push_section('masses')
+  for aa in aas:
+    lines.append('%s=%.6f' % (aa, 50 + ord(aa)/3.0))
+  lines.append('delta1=15.994915,Oxidation (M)')
+  push_section('summary')
+  for i in range(1, n_query + 1):
+    lines.append('qmass%d=%.4f' % (i, random.uniform(800, 2000)))
+    lines.append('qexp%d=%.4f,2+' % (i, random.uniform(400, 1000)))
+  push_section('peptides')
+  for i in range(1, n_query + 1):
+    for j in range(1, 3):
+      sequence = ''.join(random.choice(aas) for k in range(8))
+      mod_mask_str = '0' + ''.join(random.choice('0001') for aa in sequence) + '0'
+      hits = ','.join(
+          '"%s":0:10:17:1' % seqid for seqid in random.sample(seqids, 2))
+      lines.append(
+          'q%d_p%d=0,1000.0,0.01,3,%s,12,%s,%.2f,0000,0,0;%s' % (
+              i, j, sequence, mod_mask_str, random.uniform(0, 100), hits))
+  push_section('proteins')
+  for seqid in seqids:
+    lines.append('"%s"=10000.00,"Description of %s"' % (seqid, seqid))
+  for i in range(1, n_query + 1):
+    push_section('query%d' % i)
+    lines.append('title=spectrum%%20%d' % i)
+    lines.append('Ions1=' + ','.join(
+        '%.4f:%.4g' % (random.uniform(100, 1800), random.uniform(1, 1E5))
+        for k in range(random.randint(1, 30))))
+  lines.append('--%s--' % boundary)
+  with open(fname, 'wb') as f:
+    f.write('\n'.join(lines) + '\n')
+
+
+class MascotTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.mascot_dat = os.path.join(self.tmp_dir, 'test.dat')
+    make_mascot_dat(self.mascot_dat)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def test_index(self):
+    index = mascot.make_mascot_dat_index(self.mascot_dat)
+    self.assertEqual(index['boundary'], boundary)
+    names = [name for name, start, end in index['sections']]
+    self.assertEqual(
+        names[:5], ['parameters', 'masses', 'summary', 'peptides', 'proteins'])
+    self.assertEqual(names[5:], ['query%d' % i for i in range(1, 21)])
+    txt = open(self.mascot_dat, 'rb').read()
+    for name, start, end in index['sections']:
+      self.assertTrue(txt[end:].startswith('--' + boundary))
+      self.assertFalse('Content-Type' in txt[start:end])
+    name, start, end = index['sections'][0]
+    self.assertEqual(txt[start:end].strip(), 'MODS=Oxidation (M)')
+    name, start, end = index['sections'][5]
+    self.assertTrue(txt[start:end].strip().startswith('title=spectrum%201\n'))
+
+  def test_index_cache(self):
+    index_json = self.mascot_dat + '.index.json'
+    index = mascot.load_mascot_dat_index(self.mascot_dat)
+    self.assertTrue(os.path.isfile(index_json))
+    self.assertEqual(
+        index['sections'], mascot.make_mascot_dat_index(self.mascot_dat)['sections'])
+    # the stored index is used while the .dat file is unchanged
+    cached = json.load(open(index_json))
+    cached['sections'] = []
+    json.dump(cached, open(index_json, 'w'))
+    self.assertEqual(mascot.load_mascot_dat_index(self.mascot_dat)['sections'], [])
+    # and rebuilt once it changes
+    stat = os.stat(self.mascot_dat)
+    os.utime(self.mascot_dat, (stat.st_atime, stat.st_mtime + 10))
+    self.assertEqual(
+        mascot.load_mascot_dat_index(self.mascot_dat)['sections'], index['sections'])
+
+  def test_lazy_and_pool(self):
+    def get_proteins_json(**kwargs):
+      proteins = mascot.get_proteins(self.mascot_dat, 80, 10, **kwargs)
+      return json.dumps(proteins, sort_keys=True)
+    expected = get_proteins_json(is_lazy_queries=False)
+    self.assertTrue('spectrum' in expected)
+    self.assertEqual(get_proteins_json(), expected)
+    self.assertEqual(get_proteins_json(n_worker=2), expected)
+
+
+if __name__ == '__main__':
+  unittest.main()
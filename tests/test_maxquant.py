@@ -0,0 +1,92 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from peptagram import maxquant
+
+
+def write_tsv(fname, titles, rows):
+  with open(fname, 'w') as f:
+    f.write('\t'.join(titles) + '\n')
+    for row in rows:
+      f.write('\t'.join(map(str, row)) + '\n')
+
+
+def make_maxquant_dir(in_dir, n_scan=200):
+  "Writes a small synthetic MaxQuant txt directory"
+  random.seed(3)
+  seqids = ['YAL%03dW' % i for i in range(10)]
+  peptides = [
+      ''.join(random.choice('ACDEFGHIKLMNPQRSTVWY') for i in range(8)) + 'K'
+      for j in range(30)]
+  raw_files = ['run_a', 'run_b', 'run_c']
+  write_tsv(
+      os.path.join(in_dir, 'proteinGroups.txt'),
+      ['Protein IDs', 'Majority protein IDs', 'Peptides', 'id', 'Ratio H/L'],
+      [[seqid, seqid, 3, i, 1.5] for i, seqid in enumerate(seqids)])
+  write_tsv(
+      os.path.join(in_dir, 'peptides.txt'),
+      ['Sequence', 'Unique (Groups)', 'Protein group IDs', 'id'],
+      [[p, 'yes', i % 10, i] for i, p in enumerate(peptides)])
+  evidences = []
+  for i in range(n_scan//2):
+    i_peptide = random.randrange(len(peptides))
+    evidences.append([
+        peptides[i_peptide], '_%s_' % peptides[i_peptide],
+        random.choice(raw_files), random.choice(['', '123456', '1.5E6']),
+        i, i, i_peptide])
+  write_tsv(
+      os.path.join(in_dir, 'evidence.txt'),
+      ['Sequence', 'Modified sequence', 'Raw file', 'Intensity',
+       'Mod. peptide ID', 'id', 'Peptide ID'],
+      evidences)
+  scans = []
+  for i in range(n_scan):
+    evidence = random.choice(evidences)
+    i_peptide = evidence[-1]
+    n_peak = random.randint(1, 20)
+    scans.append([
+        evidence[2], i + 100, evidence[0], 'Unmodified', evidence[1], 'X',
+        random.choice([2, 3]), '%.4f' % random.uniform(300, 1200),
+        '%g' % 10**random.uniform(-12, 0), 0, '%.2f' % random.uniform(1, 100),
+        0,
+        ';'.join('y%d' % random.randint(1, 9) for j in range(n_peak)),
+        ';'.join('%.1f' % random.uniform(1, 1E5) for j in range(n_peak)),
+        ';'.join('%.4f' % random.uniform(100, 1500) for j in range(n_peak)),
+        i, i_peptide % 10, i_peptide, evidence[5]])
+  write_tsv(
+      os.path.join(in_dir, 'msms.txt'),
+      ['Raw file', 'Scan number', 'Sequence', 'Modifications',
+       'Modified sequence', 'Proteins', 'Charge', 'm/z', 'PEP',
+       'Missed cleavages', 'Retention time', 'Labeling state', 'Matches',
+       'Intensities', 'Masses', 'id', 'Protein group IDs', 'Peptide ID',
+       'Evidence ID'],
+      scans)
+
+
+class MaxquantTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    make_maxquant_dir(self.tmp_dir)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def get_json(self, **kwargs):
+    proteins, sources = maxquant.get_proteins_and_sources(
+        self.tmp_dir, **kwargs)
+    return json.dumps([proteins, sources], sort_keys=True)
+
+  def test_pool(self):
+    expected = self.get_json()
+    self.assertTrue('"spectrum": [[' in expected)
+    self.assertEqual(self.get_json(n_worker=3), expected)
+    self.assertEqual(self.get_json(n_worker=3, is_two_pass=True), expected)
+
+
+if __name__ == '__main__':
+  unittest.main()
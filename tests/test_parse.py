@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from peptagram import parse
+
+
+class TsvTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def write_tsv(self, lines):
+    fname = os.path.join(self.tmp_dir, 'test.txt')
+    with open(fname, 'w') as f:
+      f.write(''.join(line + '\n' for line in lines))
+    return fname
+
+  def test_short_row(self):
+    tsv = self.write_tsv([
+        'Id\tScore\tMass',
+        '1\t2.5\t100.5',
+        '2\t3.5',
+        '3\t\t300.5',
+    ])
+    parse_list = [('id', int), ('score', float), ('mass', float)]
+    rows = list(parse.iter_tsv_rows(tsv, parse_list=parse_list))
+    self.assertEqual(rows[0].items(), [('id', 1), ('score', 2.5), ('mass', 100.5)])
+    self.assertEqual(rows[1].keys(), ['id', 'score'])
+    self.assertFalse('mass' in rows[1])
+    self.assertEqual(rows[1].get('mass'), None)
+    self.assertEqual(rows[2]['score'], '')
+    self.assertEqual(
+        list(parse.read_tsv(tsv, parse_list)),
+        [{'id': 1, 'score': 2.5, 'mass': 100.5},
+         {'id': 2, 'score': 3.5},
+         {'id': 3, 'score': '', 'mass': 300.5}])
+
+  def test_tsv_row(self):
+    tsv = self.write_tsv(['A\tB\tC', 'x\ty\tz'])
+    row = list(parse.iter_tsv_rows(tsv))[0]
+    self.assertEqual(row['b'], 'y')
+    self.assertTrue('c' in row)
+    self.assertFalse('d' in row)
+    self.assertEqual(row.get('d', 0), 0)
+    self.assertEqual(row.keys(), ['a', 'b', 'c'])
+    self.assertEqual(row.items(), [('a', 'x'), ('b', 'y'), ('c', 'z')])
+
+  def test_keys(self):
+    tsv = self.write_tsv(['A\tB\tC', 'x\ty\tz', '', 'u\tv\tw'])
+    rows = list(parse.iter_tsv_rows(tsv, keys=['c', 'a', 'd']))
+    self.assertEqual([row.items() for row in rows],
+                     [[('c', 'z'), ('a', 'x')], [('c', 'w'), ('a', 'u')]])
+
+
+class TsvByteRangeTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def write_tsv(self, txt):
+    fname = os.path.join(self.tmp_dir, 'test.txt')
+    with open(fname, 'wb') as f:
+      f.write(txt)
+    return fname
+
+  def assert_chunks(self, txt, n_range):
+    tsv = self.write_tsv(txt)
+    byte_ranges = parse.get_tsv_byte_ranges(tsv, n_range)
+    self.assertTrue(1 <= len(byte_ranges) <= n_range)
+    self.assertEqual(byte_ranges[0][0], txt.index('\n') + 1)
+    self.assertEqual(byte_ranges[-1][1], len(txt))
+    for (start, end), (next_start, next_end) in zip(byte_ranges, byte_ranges[1:]):
+      self.assertEqual(end, next_start)
+    for start, end in byte_ranges:
+      self.assertTrue(start < end)
+      self.assertEqual(txt[start - 1], '\n')
+    rows = []
+    for byte_range in byte_ranges:
+      rows.extend(
+          row.items() for row in parse.iter_tsv_rows(tsv, byte_range=byte_range))
+    self.assertEqual(rows, [row.items() for row in parse.iter_tsv_rows(tsv)])
+
+  def test_chunks(self):
+    lines = ['Id\tPeptide'] + \
+        ['%d\t%s' % (i, 'PEPTIDE'*(i % 7)) for i in range(100)]
+    for newline in ['\n', '\r\n']:
+      txt = newline.join(lines)
+      for n_range in [1, 2, 3, 8, 100, 1000]:
+        self.assert_chunks(txt, n_range)
+        self.assert_chunks(txt + newline, n_range)
+
+  def test_one_line(self):
+    self.assert_chunks('Id\tPeptide\n1\tPEPTIDE\n', 4)
+
+
+if __name__ == '__main__':
+  unittest.main()
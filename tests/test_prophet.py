@@ -0,0 +1,161 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from peptagram import prophet
+
+
+distribution = [
+  {'error': 0.0, 'prob': 1.0},
+  {'error': 0.01, 'prob': 0.97},
+  {'error': 0.02, 'prob': 0.9},
+  {'error': 0.05, 'prob': 0.9},
+  {'error': 0.1, 'prob': 0.4},
+  {'error': 0.6, 'prob': 0.0},
+]
+
+
+class DistributionLookupTest(unittest.TestCase):
+
+  def assert_same_as_scan(self, distribution, probs, errors):
+    lookup = prophet.DistributionLookup(distribution)
+    for prob in probs:
+      self.assertEqual(
+          lookup.probability_to_error(prob),
+          prophet.probability_to_error(distribution, prob))
+    for error in errors:
+      self.assertEqual(
+          lookup.error_to_probability(error),
+          prophet.error_to_probability(distribution, error))
+    self.assertEqual(
+        lookup.probabilities_to_errors(probs),
+        [prophet.probability_to_error(distribution, p) for p in probs])
+
+  def test_lookup(self):
+    random.seed(1)
+    probs = [random.uniform(-0.1, 1.1) for i in range(200)]
+    probs.extend(d['prob'] for d in distribution if d['prob'] != 0.9)
+    errors = [random.uniform(-0.1, 0.7) for i in range(200)]
+    errors.extend(d['error'] for d in distribution)
+    self.assert_same_as_scan(distribution, probs, errors)
+
+  def test_unsorted(self):
+    unsorted = [distribution[0], distribution[2], distribution[1]]
+    self.assertFalse(prophet.DistributionLookup(unsorted).is_prob_sorted)
+    self.assert_same_as_scan(
+        unsorted, [0.95, 0.92, 0.5], [0.005, 0.015, 0.5])
+
+
+protxml_ns = 'http://regis-web.systemsbiology.net/protXML'
+pepxml_ns = 'http://regis-web.systemsbiology.net/pepXML'
+
+
+def make_protxml(fname, peptides_by_seqid):
+  lines = [
+    '<?xml version="1.0"?>',
+    '<protein_summary xmlns="%s">' % protxml_ns,
+    '<protein_summary_header><program_details><proteinprophet_details>',
+  ]
+  for error, prob in [(0.0, 1.0), (0.01, 0.9), (0.1, 0.5), (0.5, 0.0)]:
+    lines.append(
+        '<protein_summary_data_filter min_probability="%s" '
+        'false_positive_error_rate="%s"/>' % (prob, error))
+  lines.append('</proteinprophet_details></program_details></protein_summary_header>')
+  for i_group, seqid in enumerate(sorted(peptides_by_seqid)):
+    lines.append('<protein_group group_number="%d" probability="1">' % (i_group + 1))
+    lines.append(
+        '<protein protein_name="%s" n_indistinguishable_proteins="1" '
+        'probability="1.0" percent_coverage="12.5" group_sibling_id="a" '
+        'total_number_peptides="2">' % seqid)
+    lines.append('<parameter name="prot_length" value="300"/>')
+    lines.append('<annotation protein_description="%s"/>' % seqid)
+    for peptide in peptides_by_seqid[seqid]:
+      lines.append(
+          '<peptide peptide_sequence="%s" charge="2" initial_probability="0.9" '
+          'nsp_adjusted_probability="0.8" weight="1.00" '
+          'is_contributing_evidence="Y" n_instances="1"/>' % peptide)
+    lines.append('</protein>')
+    lines.append('</protein_group>')
+  lines.append('</protein_summary>')
+  with open(fname, 'w') as f:
+    f.write('\n'.join(lines) + '\n')
+
+
+def make_pepxml(fname, peptides_by_seqid, base_names):
+  seqids = sorted(peptides_by_seqid)
+  lines = [
+    '<?xml version="1.0"?>',
+    '<msms_pipeline_analysis xmlns="%s">' % pepxml_ns,
+    '<analysis_summary analysis="peptideprophet"><peptideprophet_summary>',
+    '<roc_error_data charge="all">',
+  ]
+  for error, prob in [(0.0, 1.0), (0.02, 0.9), (0.1, 0.4), (0.6, 0.0)]:
+    lines.append('<error_point error="%s" min_prob="%s"/>' % (error, prob))
+  lines.append('</roc_error_data></peptideprophet_summary></analysis_summary>')
+  for base_name in base_names:
+    lines.append('<msms_run_summary base_name="%s">' % base_name)
+    for i_scan in range(1, 40):
+      seqid = random.choice(seqids)
+      peptide = random.choice(peptides_by_seqid[seqid])
+      lines.append(
+          '<spectrum_query start_scan="%d" end_scan="%d" '
+          'precursor_neutral_mass="1000.5" assumed_charge="2" index="%d">' % (
+              i_scan % 30, i_scan % 30, i_scan))
+      lines.append('<search_result>')
+      lines.append(
+          '<search_hit hit_rank="1" peptide="%s" protein="%s" '
+          'num_tot_proteins="1" num_matched_ions="5" tot_num_ions="18" '
+          'massdiff="0.01" num_missed_cleavages="0">' % (peptide, seqid))
+      lines.append('<search_score name="expect" value="%g"/>' % 10**random.uniform(-12, -1))
+      lines.append(
+          '<analysis_result analysis="peptideprophet">'
+          '<peptideprophet_result probability="%.4f"><search_score_summary>'
+          '<parameter name="fval" value="1.5"/>'
+          '</search_score_summary></peptideprophet_result></analysis_result>' % \
+              random.uniform(0.5, 1))
+      lines.append('</search_hit>')
+      lines.append('</search_result>')
+      lines.append('</spectrum_query>')
+    lines.append('</msms_run_summary>')
+  lines.append('</msms_pipeline_analysis>')
+  with open(fname, 'w') as f:
+    f.write('\n'.join(lines) + '\n')
+
+
+class ProphetTest(unittest.TestCase):
+
+  def setUp(self):
+    random.seed(1)
+    self.tmp_dir = tempfile.mkdtemp()
+    peptides_by_seqid = {}
+    for i in range(5):
+      peptides_by_seqid['sp|P%05d|' % i] = [
+          'PEPTIDE%sK' % ''.join(random.choice('ACDEFGHW') for j in range(3))
+          for k in range(3)]
+    self.protxml = os.path.join(self.tmp_dir, 'test.prot.xml')
+    make_protxml(self.protxml, peptides_by_seqid)
+    self.pepxmls = []
+    for i in range(3):
+      pepxml = os.path.join(self.tmp_dir, 'test%d.pep.xml' % i)
+      base_names = ['/data/run%d_%d' % (i, j) for j in range(2)]
+      make_pepxml(pepxml, peptides_by_seqid, base_names)
+      self.pepxmls.append(pepxml)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def test_pool(self):
+    def get_json(n_worker):
+      proteins, sources = prophet.get_proteins_and_sources(
+          self.protxml, self.pepxmls, peptide_error=0.1, n_worker=n_worker)
+      return json.dumps([proteins, sources], sort_keys=True)
+    expected = get_json(1)
+    self.assertTrue('"matches": [{' in expected)
+    self.assertEqual(get_json(3), expected)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,228 @@
+import unittest
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+from peptagram import proteins
+
+
+class TopPeaksTest(unittest.TestCase):
+
+  peaks = [(100.0, 5.0), (200.0, 9.0), (300.0, 5.0), (400.0, 1.0)]
+
+  def test_list(self):
+    top_peaks = proteins.get_top_peaks(iter(self.peaks), 3)
+    self.assertEqual(top_peaks, [(200.0, 9.0), (100.0, 5.0), (300.0, 5.0)])
+
+  @unittest.skipIf(np is None, 'requires numpy')
+  def test_array(self):
+    top_peaks = proteins.get_top_peaks(np.array(self.peaks), 3)
+    self.assertEqual(top_peaks, [(200.0, 9.0), (100.0, 5.0), (300.0, 5.0)])
+    self.assertEqual(type(top_peaks), list)
+    self.assertEqual(type(top_peaks[0][0]), float)
+    self.assertEqual(proteins.get_top_peaks(np.array(self.peaks), 9),
+                     proteins.get_top_peaks(self.peaks, 9))
+
+
+def make_proteins(sequence_by_seqid, peptides_by_seqid):
+  result = {}
+  for seqid, sequence in sequence_by_seqid.items():
+    protein = proteins.new_protein(seqid)
+    protein['sequence'] = sequence
+    protein['sources'] = [{
+      'matches': map(proteins.new_match, peptides_by_seqid.get(seqid, []))
+    }]
+    result[seqid] = protein
+  return result
+
+
+class PeptideLocatorTest(unittest.TestCase):
+
+  def test_find(self):
+    test_proteins = make_proteins({'a': 'MKLLPEPKLLP', 'b': 'MIIPEP'}, {})
+    locator = proteins.PeptideLocator(test_proteins)
+    for seqid, peptide in [
+        ('a', 'LLP'), ('a', 'PEP'), ('a', 'MK'), ('a', 'XX'), ('b', 'LLP')]:
+      expected = test_proteins[seqid]['sequence'].find(peptide)
+      self.assertEqual(locator.find(seqid, peptide), expected)
+      self.assertEqual(locator.find(seqid, peptide), expected)
+
+  def test_iso_leu_isomerism(self):
+    test_proteins = make_proteins({'b': 'MIIPEP'}, {})
+    locator = proteins.PeptideLocator(test_proteins, iso_leu_isomerism=True)
+    self.assertEqual(locator.find('b', 'LLP'), 1)
+    self.assertEqual(locator.find('b', 'ILP'), 1)
+
+  def test_place_matches(self):
+    test_proteins = make_proteins(
+        {'a': 'MKLLPEPKLLP'}, {'a': ['LLP', 'XX', 'PEP', 'LLP']})
+    matches = test_proteins['a']['sources'][0]['matches']
+    locator = proteins.PeptideLocator(test_proteins)
+    locator.place_matches('a', matches)
+    self.assertEqual(
+        [(m['sequence'], m['i']) for m in matches],
+        [('LLP', 2), ('PEP', 4), ('LLP', 2)])
+
+  def test_load_fastas_into_proteins(self):
+    test_proteins = make_proteins(
+        {'a': 'MKLLPEPKLLP', 'b': 'MIIPEP'}, {'a': ['LLP'], 'b': ['PEP']})
+    proteins.calculate_peptide_positions(test_proteins)
+    # a stale position that is not the first occurrence is located again
+    test_proteins['a']['sources'][0]['matches'][0]['i'] = 8
+    fastas = {
+      'a': {'sequence': 'MKLLPEPKLLP', 'description': 'A'},
+      'b': {'sequence': 'MPEPIIPEP', 'description': 'B'},
+    }
+    proteins.load_fastas_into_proteins(test_proteins, fastas)
+    self.assertEqual(test_proteins['a']['sources'][0]['matches'][0]['i'], 2)
+    self.assertEqual(test_proteins['b']['sources'][0]['matches'][0]['i'], 1)
+    self.assertEqual(test_proteins['b']['attr']['length'], 9)
+
+
+class PackSpectrumTest(unittest.TestCase):
+
+  def test_round_trip(self):
+    spectrum = [[100.25, 5.5], [200.125, 9.0, 'y2'], [300.5, 0.75]]
+    packed, labels = proteins.pack_spectrum(spectrum)
+    self.assertEqual(labels, ['', 'y2', ''])
+    self.assertEqual(proteins.unpack_spectrum(packed, labels), spectrum)
+    packed, labels = proteins.pack_spectrum([(100.1, 5.0)])
+    self.assertEqual(labels, None)
+    [[mz, intensity]] = proteins.unpack_spectrum(packed)
+    self.assertAlmostEqual(mz, 100.1, places=4)
+    self.assertEqual(intensity, 5.0)
+
+  def test_match_spectra(self):
+    spectrum = [[100.25, 5.5, 'b1'], [200.125, 9.0]]
+    test_proteins = make_proteins({'a': 'PEPTIDE'}, {'a': ['PEP', 'TIDE', 'PT']})
+    matches = test_proteins['a']['sources'][0]['matches']
+    matches[0]['spectrum'] = spectrum
+    matches[1]['spectrum'] = spectrum
+    proteins.pack_match_spectra(test_proteins)
+    self.assertTrue(isinstance(matches[0]['spectrum'], basestring))
+    self.assertEqual(matches[0]['spectrum'], matches[1]['spectrum'])
+    self.assertFalse('spectrum' in matches[2])
+    proteins.unpack_match_spectra(test_proteins)
+    self.assertEqual(matches[0]['spectrum'], spectrum)
+    self.assertEqual(matches[1]['spectrum'], spectrum)
+    self.assertFalse('spectrum_labels' in matches[0])
+
+  def test_scan_spectra(self):
+    scans = {'0:1': {'attr': {}, 'spectrum': [[100.25, 5.5]]}, '0:2': {'attr': {}}}
+    proteins.pack_scan_spectra(scans)
+    packed = scans['0:1']['spectrum']
+    self.assertEqual(proteins.unpack_spectrum(packed), [[100.25, 5.5]])
+    self.assertFalse('spectrum' in scans['0:2'])
+
+
+class ColumnarTest(unittest.TestCase):
+
+  def make_source(self):
+    return {'matches': [
+      {'sequence': 'PEP', 'i': 0, 'intensity': 0.5, 'modifications': [],
+       'attr': {'charge': 2, 'mass': 1000.12345, 'source': 'a.raw'}},
+      {'sequence': 'TIDE', 'i': 3, 'intensity': 0.25,
+       'modifications': [{'i': 1, 'mass': 147.0}],
+       'attr': {'charge': 3, 'source': 'a.raw', 'is_unique': True}},
+    ]}
+
+  def test_round_trip(self):
+    source = self.make_source()
+    strings = []
+    proteins.columnize_source(source, strings, {})
+    self.assertFalse('matches' in source)
+    self.assertEqual(sorted(strings), ['PEP', 'TIDE', 'a.raw'])
+    self.assertEqual(source['columns']['attr.mass'], [10001235, None])
+    proteins.decolumnize_source(source, strings)
+    expected = self.make_source()
+    expected['matches'][0]['attr']['mass'] = 1000.1235
+    self.assertEqual(source, expected)
+
+  def test_data(self):
+    test_proteins = make_proteins(
+        {'a': 'PEPTIDE', 'b': 'TIDE'}, {'a': ['PEP', 'TIDE'], 'b': ['TIDE']})
+    test_proteins['b']['sources'] = {1: test_proteins['b']['sources'][0]}
+    data = {'proteins': test_proteins}
+    proteins.columnize_data(data)
+    self.assertEqual(sorted(data['strings']), ['PEP', 'TIDE'])
+    self.assertEqual(test_proteins['b']['sources'][1]['n_match'], 1)
+    proteins.decolumnize_data(data)
+    self.assertFalse('strings' in data)
+    expected = make_proteins(
+        {'a': 'PEPTIDE', 'b': 'TIDE'}, {'a': ['PEP', 'TIDE'], 'b': ['TIDE']})
+    expected['b']['sources'] = {1: expected['b']['sources'][0]}
+    self.assertEqual(test_proteins, expected)
+
+
+class SparseSourcesTest(unittest.TestCase):
+
+  def make_sparse_protein(self, seqid, i_sources):
+    protein = proteins.new_protein(seqid)
+    protein['sources'] = {}
+    for i_source in i_sources:
+      proteins.get_source(protein, i_source)['matches'].append(
+          proteins.new_match('PEP%d' % i_source))
+    return protein
+
+  def test_helpers(self):
+    protein = self.make_sparse_protein('a', [3, 1])
+    self.assertEqual(sorted(protein['sources']), [1, 3])
+    self.assertEqual([i for i, source in proteins.enumerate_sources(protein)], [1, 3])
+    self.assertEqual(proteins.get_matches(protein, 2), [])
+    self.assertFalse(2 in protein['sources'])
+    self.assertEqual(proteins.get_matches(protein, 3)[0]['sequence'], 'PEP3')
+    dense_protein = proteins.new_protein('b')
+    dense_protein['sources'] = [{'matches': []}, {'matches': []}]
+    test_proteins = {'a': protein, 'b': dense_protein}
+    self.assertTrue(proteins.has_sparse_sources(test_proteins))
+    self.assertEqual(proteins.get_n_source(test_proteins), 4)
+    proteins.densify_sources(test_proteins, 5)
+    self.assertFalse(proteins.has_sparse_sources(test_proteins))
+    self.assertEqual(
+        [len(source['matches']) for source in protein['sources']],
+        [0, 1, 0, 1, 0])
+    self.assertEqual(len(dense_protein['sources']), 2)
+
+  def test_densify_json_keys(self):
+    # sparse sources read back from JSON have string keys
+    protein = self.make_sparse_protein('a', [0, 2])
+    protein['sources'] = dict(
+        (str(i), source) for i, source in protein['sources'].items())
+    proteins.densify_sources({'a': protein})
+    self.assertEqual(
+        [len(source['matches']) for source in protein['sources']], [1, 0, 1])
+
+  def test_merge_sparse(self):
+    proteins1 = {'a': self.make_sparse_protein('a', [0])}
+    proteins2 = {
+      'a': self.make_sparse_protein('a', [0]),
+      'b': self.make_sparse_protein('b', [1]),
+    }
+    # proteins1 has a trailing source without matches
+    merged = proteins.merge_two_proteins(proteins1, proteins2, 2)
+    proteins.densify_sources(merged, 4)
+    self.assertEqual(
+        [[m['sequence'] for m in source['matches']] for source in merged['a']['sources']],
+        [['PEP0'], [], ['PEP0'], []])
+    self.assertEqual(
+        [len(source['matches']) for source in merged['b']['sources']],
+        [0, 0, 0, 1])
+
+  def test_merge_dense(self):
+    protein1 = proteins.new_protein('a')
+    protein1['sources'] = [{'matches': []}, {'matches': []}]
+    protein2 = proteins.new_protein('b')
+    protein2['sources'] = [{'matches': [proteins.new_match('PEP')]}]
+    merged = proteins.merge_two_proteins({'a': protein1}, {'b': protein2}, 2)
+    self.assertEqual(len(merged['a']['sources']), 3)
+    self.assertEqual(
+        [len(source['matches']) for source in merged['b']['sources']],
+        [0, 0, 1])
+    proteins2 = {'b': protein2}
+    self.assertTrue(proteins.merge_two_proteins({}, proteins2, 0) is proteins2)
+
+
+if __name__ == '__main__':
+  unittest.main()